@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from foodgram.postgresql_pool.base import pool_metrics
+
+        from . import signals  # noqa: F401
+        from .metrics import registry
+
+        registry.register_collector(pool_metrics)
@@ -0,0 +1,135 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import LocalCache
+from .metrics import registry
+from .replicas import primary_reads
+
+options = settings.TOKEN_AUTH
+local_cache = LocalCache(options["LOCAL_MAX_ENTRIES"], options["LOCAL_TTL"])
+# Поля пользователя в кэше: проверки доступа и все, что читает
+# сериализатор пользователя (/api/users/me/). Остальные (и хэш пароля)
+# загружаются из БД при обращении, как отложенные поля only()
+CACHED_FIELDS = (
+    "id",
+    "username",
+    "email",
+    "first_name",
+    "last_name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+)
+
+
+def cache_key(key):
+    # В кэше не храним сам токен; v3 - записи без хэша пароля,
+    # с именем и фамилией
+    return "auth:token:v3:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+def shared_cache():
+    alias = options["SHARED_ALIAS"]
+    return None if alias is None else caches[alias]
+
+
+def invalidate(key):
+    """Вызывается при удалении токена и изменении пользователя."""
+    full_key = cache_key(key)
+    local_cache.delete(full_key)
+    shared = shared_cache()
+    if shared is not None:
+        shared.delete(full_key)
+
+
+def expired_before():
+    """Токены, выпущенные раньше этого момента, устарели (или None)."""
+    if options["EXPIRES_AFTER"] is None:
+        return None
+    return timezone.now() - timedelta(seconds=options["EXPIRES_AFTER"])
+
+
+def count(result):
+    registry.inc(
+        "foodgram_token_auth_cache_total",
+        "Поиск токена в кэше аутентификации",
+        {"result": result},
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к БД на каждый вызов API.
+    Пара токен -> пользователь хранится в LocalCache процесса
+    и, если задан TOKEN_AUTH["SHARED_ALIAS"], в общем кэше Django.
+    Записи удаляются при удалении токена (logout), деактивации
+    и смене пароля (api/signals.py); в других процессах локальная
+    запись живет не дольше TOKEN_AUTH["LOCAL_TTL"].
+    С TOKEN_AUTH["EXPIRES_AFTER"] токен действует ограниченное время.
+    """
+
+    def authenticate_credentials(self, key):
+        full_key = cache_key(key)
+        entry = local_cache.get(full_key)
+        if entry is not None:
+            count("local_hit")
+        else:
+            shared = shared_cache()
+            if shared is not None:
+                entry = shared.get(full_key)
+            if entry is not None:
+                count("shared_hit")
+            else:
+                count("miss")
+                with primary_reads():
+                    entry = self.load(key)
+                if shared is not None:
+                    shared.set(
+                        full_key, entry, timeout=options["SHARED_TTL"]
+                    )
+            local_cache.set(full_key, entry)
+        fields, created = entry
+        limit = expired_before()
+        if limit is not None and created < limit:
+            Token.objects.filter(key=key).delete()
+            raise AuthenticationFailed("Срок действия токена истек.")
+        if not fields["is_active"]:
+            raise AuthenticationFailed("Пользователь неактивен или удален.")
+        # Каждому запросу - свой экземпляр пользователя. from_db ждет
+        # значения в порядке полей модели
+        model = get_user_model()
+        names = [
+            field.attname
+            for field in model._meta.concrete_fields
+            if field.attname in fields
+        ]
+        user = model.from_db(
+            DEFAULT_DB_ALIAS, names, [fields[name] for name in names]
+        )
+        return user, Token(key=key, user=user, created=created)
+
+    def load(self, key):
+        try:
+            token = (
+                Token.objects.select_related("user")
+                .only(
+                    "created",
+                    *(f"user__{field}" for field in CACHED_FIELDS),
+                )
+                .get(key=key)
+            )
+        except Token.DoesNotExist:
+            raise AuthenticationFailed("Недопустимый токен.")
+        fields = {
+            field: getattr(token.user, field) for field in CACHED_FIELDS
+        }
+        return fields, token.created
@@ -0,0 +1,128 @@
+import difflib
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+
+from recipes.models import Ingredient
+
+from .replicas import primary_reads
+
+# Порог похожести difflib для индекса в памяти; в Postgres действует
+# собственный pg_trgm.similarity_threshold (0.3 по умолчанию)
+FUZZY_CUTOFF = 0.75
+
+
+class IngredientIndex:
+    """
+    Префиксный индекс ингредиентов в памяти процесса.
+    Отсортированный массив имен с бинарным поиском отвечает на те же
+    запросы, что и префиксное дерево, но занимает меньше памяти.
+    Перестраивается лениво после invalidate() или по истечении TTL.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.built_at = None
+        self.names = []
+        self.items = []
+        self.by_name = {}
+
+    def invalidate(self):
+        with self.lock:
+            self.built_at = None
+
+    def build(self):
+        items = list(
+            Ingredient.objects.values("id", "name", "measurement_unit")
+        )
+        # Порядок Python, а не collation БД: на нем работает bisect
+        items.sort(key=lambda item: (item["name"], item["id"]))
+        by_name = {}
+        for item in items:
+            by_name.setdefault(item["name"], []).append(item)
+        self.names = [item["name"] for item in items]
+        self.items = items
+        self.by_name = by_name
+        self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        with self.lock:
+            if (
+                self.built_at is None
+                or time.monotonic() - self.built_at > self.ttl
+            ):
+                # Индекс живет TTL: не строим его с отстающей реплики
+                with primary_reads():
+                    self.build()
+            return self.names, self.items, self.by_name
+
+    def search(self, term, limit):
+        names, items, by_name = self.ensure_built()
+        result = []
+        position = bisect_left(names, term)
+        while (
+            position < len(names)
+            and names[position].startswith(term)
+            and len(result) < limit
+        ):
+            result.append(items[position])
+            position += 1
+        if len(result) < limit:
+            seen = {item["id"] for item in result}
+            matches = difflib.get_close_matches(
+                term, by_name, n=limit * 2, cutoff=FUZZY_CUTOFF
+            )
+            for name in matches:
+                for item in by_name[name]:
+                    if item["id"] not in seen and len(result) < limit:
+                        seen.add(item["id"])
+                        result.append(item)
+        return result
+
+
+ingredient_index = IngredientIndex(
+    ttl=getattr(settings, "INGREDIENT_AUTOCOMPLETE_INDEX_TTL", 300)
+)
+
+
+def search_ingredients(term, limit):
+    """
+    Сначала ингредиенты, чье имя начинается с term (точное совпадение
+    идет первым), затем похожие по триграммам - с учетом опечаток.
+    Вне Postgres вместо триграмм ищется подстрока: опечатки находит
+    только индекс в памяти (INGREDIENT_AUTOCOMPLETE_IN_MEMORY).
+    Возвращает не больше limit словарей id/name/measurement_unit.
+    """
+    term = term.strip().lower()
+    if not term:
+        return []
+    if getattr(settings, "INGREDIENT_AUTOCOMPLETE_IN_MEMORY", False):
+        return ingredient_index.search(term, limit)
+
+    fields = ("id", "name", "measurement_unit")
+    # LIKE 'term%' использует индекс с varchar_pattern_ops
+    result = list(
+        Ingredient.objects.filter(name__startswith=term)
+        .order_by("name", "id")
+        .values(*fields)[:limit]
+    )
+    if len(result) >= limit:
+        return result
+    fuzzy = Ingredient.objects.exclude(
+        id__in=[item["id"] for item in result]
+    )
+    if connections[fuzzy.db].vendor == "postgresql":
+        # Оператор % использует GIN-индекс gin_trgm_ops
+        fuzzy = (
+            fuzzy.filter(name__trigram_similar=term)
+            .annotate(similarity=TrigramSimilarity("name", term))
+            .order_by("-similarity", "name")
+        )
+    else:
+        fuzzy = fuzzy.filter(name__contains=term).order_by("name")
+    return result + list(fuzzy.values(*fields)[:limit - len(result)])
@@ -0,0 +1,175 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from recipes.models import DataVersion
+
+from .replicas import primary_reads
+
+
+class LocalCache:
+    """LRU-кэш в памяти процесса с ограничением по времени жизни."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class ReferenceCache:
+    """
+    Двухуровневый кэш справочника (теги, ингредиенты).
+    Локальный уровень - LocalCache, общий - кэш Django из
+    REFERENCE_CACHE["ALIAS"] (файловый, Redis и т.п.; в тестах - locmem).
+    Записи привязаны к версии справочника в БД (DataVersion);
+    invalidate() увеличивает ее, и старые записи перестают читаться во
+    всех процессах, даже если кэш Django у каждого процесса свой.
+    Счетчик и время изменения версии входят в ETag и ключи записей,
+    время изменения отдается в Last-Modified.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        options = settings.REFERENCE_CACHE
+        self.shared_alias = options["ALIAS"]
+        self.shared_ttl = options["SHARED_TTL"]
+        self.local = LocalCache(
+            options["LOCAL_MAX_ENTRIES"], options["LOCAL_TTL"]
+        )
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    @property
+    def version_name(self):
+        return f"reference:{self.namespace}"
+
+    def version(self):
+        return DataVersion.current(self.version_name)
+
+    def invalidate(self):
+        self.local.clear()
+        DataVersion.bump(self.version_name)
+
+    def etag(self, version, key):
+        return make_etag(self.namespace, version, key)
+
+    def get_or_build(self, version, key, build):
+        full_key = f"reference:{self.namespace}:{version}:{key}"
+        data = self.local.get(full_key)
+        if data is not None:
+            return data
+        data = self.shared.get(full_key)
+        if data is None:
+            # Запись живет SHARED_TTL: собираем ее из основной БД
+            with primary_reads():
+                data = build()
+            self.shared.set(full_key, data, timeout=self.shared_ttl)
+        self.local.set(full_key, data)
+        return data
+
+
+def conditional_response(request, etag, last_modified=None):
+    """
+    Ответ 304, если клиентская копия актуальна, иначе None.
+    last_modified - unix-время; передавайте его, только если ETag
+    не несет дополнительной информации (например, флагов пользователя).
+    """
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=None if last_modified is None else int(last_modified),
+    )
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(
+        ":".join(str(part) for part in parts).encode()
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+class ReferenceCacheMixin:
+    """
+    Кэширует ответы list/retrieve справочника и поддерживает
+    условные запросы: при совпадении If-None-Match/If-Modified-Since
+    ответ 304 отдается после одного чтения версии справочника.
+    """
+
+    reference_cache = None
+
+    def cached_response(self, request, build):
+        cache = self.reference_cache
+        key = request.get_full_path()
+        version = cache.version()
+        modified = version.updated_at.timestamp()
+        etag = cache.etag(version.token, key)
+        response = conditional_response(request, etag, modified)
+        if response is None:
+            response = Response(
+                cache.get_or_build(version.token, key, build)
+            )
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        parent_list = super().list
+        return self.cached_response(
+            request,
+            lambda: plain(parent_list(request, *args, **kwargs).data),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        parent_retrieve = super().retrieve
+        return self.cached_response(
+            request,
+            lambda: plain(parent_retrieve(request, *args, **kwargs).data),
+        )
+
+
+def plain(data):
+    """ReturnList/ReturnDict -> list/dict, пригодные для pickle."""
+    if isinstance(data, list):
+        return [dict(item) for item in data]
+    return dict(data)
+
+
+tags_cache = ReferenceCache("tags")
+ingredients_cache = ReferenceCache("ingredients")
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import os
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient
+
+# Сколько строк агрегации читать из серверного курсора за раз
+CHUNK_SIZE = 500
+
+Exporter = namedtuple("Exporter", ("content_type", "extension", "render"))
+
+
+def shopping_cart_rows(user):
+    """
+    Суммарное количество каждого ингредиента из корзины пользователя.
+    Строки читаются через iterator() (серверный курсор в Postgres),
+    поэтому агрегация не загружается в память целиком.
+    """
+    return (
+        RecipeIngredient.objects.filter(recipe__shoppinglist__user=user)
+        .values_list("ingredient__name", "ingredient__measurement_unit")
+        .annotate(amount=Sum("amount"))
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def render_txt(rows):
+    yield "Список покупок:\n"
+    for name, measurement_unit, amount in rows:
+        yield f"\n{name} {measurement_unit} {amount}"
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("name", "measurement_unit", "amount"))
+    for name, measurement_unit, amount in rows:
+        writer.writerow((name, measurement_unit, amount))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_json(rows):
+    separator = "["
+    for name, measurement_unit, amount in rows:
+        item = json.dumps(
+            {
+                "name": name,
+                "measurement_unit": measurement_unit,
+                "amount": amount,
+            },
+            ensure_ascii=False,
+        )
+        yield f"{separator}{item}"
+        separator = ","
+    # Пустая корзина отдается как []
+    yield "[]" if separator == "[" else "]"
+
+
+EXPORTERS = {
+    "txt": Exporter("text/plain; charset=utf-8", "txt", render_txt),
+    "csv": Exporter("text/csv; charset=utf-8", "csv", render_csv),
+    "json": Exporter("application/json", "json", render_json),
+}
+
+
+def export_storage():
+    """
+    Файлы фоновых выгрузок: вне MEDIA_ROOT, поэтому gateway их не отдает.
+    Скачать файл может только владелец задачи (JobViewSet.download).
+    """
+    return FileSystemStorage(location=settings.EXPORTS["ROOT"])
+
+
+def collect_expired_exports():
+    """Удаляет выгрузки старше EXPORTS["TTL"]; возвращает их число."""
+    storage = export_storage()
+    if not os.path.isdir(storage.location):
+        return 0
+    deadline = time.time() - settings.EXPORTS["TTL"]
+    removed = 0
+    for name in storage.listdir("")[1]:
+        try:
+            expired = os.path.getmtime(storage.path(name)) < deadline
+        except FileNotFoundError:
+            continue
+        if expired:
+            storage.delete(name)
+            removed += 1
+    return removed
@@ -0,0 +1,92 @@
+import base64
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from rest_framework.serializers import Field, ImageField, ValidationError
+
+from recipes.storage import recipe_image_storage
+
+
+class Base64ImageField(ImageField):
+    """
+    Картинка в виде data:image/<формат>;base64,...
+    Размер проверяется до декодирования, а данные декодируются частями
+    во временный файл, без второй полной копии в памяти.
+    """
+
+    chunk_size = 64 * 1024  # кратно 4 символам base64
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith("data:image"):
+            data = self.decode(data)
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        try:
+            header, encoded = data.split(";base64,", 1)
+        except ValueError:
+            raise ValidationError("Картинка должна быть в base64")
+        ext = header.split("/")[-1].lower()
+        if ext not in settings.RECIPE_IMAGE_FORMATS:
+            raise ValidationError(f"Формат {ext} не поддерживается")
+        size = len(encoded) * 3 // 4 - encoded[-2:].count("=")
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(
+                "Картинка не должна превышать "
+                f"{settings.RECIPE_IMAGE_MAX_SIZE} байт"
+            )
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            for start in range(0, len(encoded), self.chunk_size):
+                file.write(
+                    base64.b64decode(
+                        encoded[start:start + self.chunk_size], validate=True
+                    )
+                )
+        except ValueError:
+            # binascii.Error или не-ASCII символы в строке
+            file.close()
+            raise ValidationError("Некорректные данные base64")
+        file.seek(0)
+        return File(file, name="temp." + ext)
+
+
+class ImageVariantsField(Field):
+    """
+    URL уменьшенных копий картинки рецепта:
+    {"thumbnail": {"webp": ..., "jpeg": ...}, "card": ..., "full": ...}.
+    None, пока копии для текущей картинки не построены.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return image_variant_urls(
+            recipe.image.name if recipe.image else None,
+            recipe.image_variants,
+            self.context.get("request"),
+        )
+
+
+def image_variant_urls(image, image_variants, request=None):
+    """
+    URL копий по имени картинки и значению Recipe.image_variants.
+    Общий код ImageVariantsField и api/projections.py.
+    """
+    if not image or (image_variants or {}).get("source") != image:
+        return None
+    result = {}
+    for variant, formats in image_variants["variants"].items():
+        result[variant] = {}
+        for extension, name in formats.items():
+            url = recipe_image_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            result[variant][extension] = url
+    return result
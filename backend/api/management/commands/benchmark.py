@@ -0,0 +1,220 @@
+import json
+import platform
+import statistics
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def percentile(values, share):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(round(share * len(ordered) + 0.5) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def scenarios(recipe, tags, ingredient):
+    """Имя -> URL. Пути строятся через reverse по api/urls.py."""
+    tag = tags[0]
+    prefix = ingredient.name[:3]
+    recipes = reverse("recipes-list")
+    return {
+        "recipes.list": f"{recipes}?page=1&limit=6",
+        "recipes.list.large": f"{recipes}?page=1&limit=100",
+        "recipes.list.deep": f"{recipes}?page=50&limit=6",
+        "recipes.list.cursor": f"{recipes}?cursor=&limit=6",
+        "recipes.list.filtered": f"{recipes}?"
+        + urlencode({"tags": tag.slug, "is_favorited": 1, "limit": 6}),
+        # Сочетание фильтров RecipeFilterSet (Exists по каждому)
+        "recipes.list.combined": f"{recipes}?"
+        + urlencode(
+            {
+                "tags": [item.slug for item in tags],
+                "author": recipe.author_id,
+                "is_favorited": 1,
+                "limit": 6,
+            },
+            doseq=True,
+        ),
+        "recipes.list.excluded": f"{recipes}?"
+        + urlencode(
+            {
+                "tags": [item.slug for item in tags],
+                "is_in_shopping_cart": 0,
+                "limit": 6,
+            },
+            doseq=True,
+        ),
+        "recipes.list.author": f"{recipes}?"
+        + urlencode({"author": recipe.author_id, "limit": 6}),
+        "recipes.retrieve": reverse("recipes-detail", args=(recipe.pk,)),
+        "recipes.download_shopping_cart": reverse(
+            "recipes-download-shopping-cart"
+        ),
+        "subscriptions.list": reverse("follow-list")
+        + "?limit=6&recipes_limit=3",
+        "users.list": reverse("users_follow-list") + "?limit=6",
+        "users.me": reverse("users_follow-me"),
+        "tags.list": reverse("tags-list"),
+        "ingredients.list": reverse("ingredients-list")
+        + "?"
+        + urlencode({"name": prefix}),
+        "ingredients.autocomplete": reverse("ingredients-autocomplete")
+        + "?"
+        + urlencode({"name": prefix}),
+    }
+
+
+# python manage.py benchmark --requests 200 --output bench.json
+class Command(BaseCommand):
+    help = (
+        "Прогоняет запросы к API через тестовый клиент Django и выводит "
+        "p50/p95/p99 времени ответа и число SQL-запросов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100,
+                            help="Запросов на сценарий")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--user", help="email пользователя; по "
+                            "умолчанию - с наибольшим числом подписок")
+        parser.add_argument("--only", nargs="*", default=(),
+                            help="Имена сценариев")
+        parser.add_argument("--host", default="localhost")
+        parser.add_argument("--output", help="Файл для результатов в JSON")
+        parser.add_argument("--compare", help="JSON предыдущего прогона")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["user"])
+        recipe = Recipe.objects.order_by("-pub_date", "-id").first()
+        tags = list(Tag.objects.all()[:2])
+        ingredient = Ingredient.objects.first()
+        if recipe is None or not tags or ingredient is None:
+            raise CommandError(
+                "Нет данных: выполните python manage.py generate_data"
+            )
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(
+            HTTP_HOST=options["host"],
+            HTTP_AUTHORIZATION=f"Token {token.key}",
+        )
+        selected = scenarios(recipe, tags, ingredient)
+        if options["only"]:
+            unknown = set(options["only"]) - set(selected)
+            if unknown:
+                raise CommandError(
+                    "Неизвестные сценарии: " + ", ".join(sorted(unknown))
+                )
+            selected = {
+                name: url
+                for name, url in selected.items()
+                if name in options["only"]
+            }
+        results = {
+            name: self.measure(
+                client, url, options["requests"], options["warmup"]
+            )
+            for name, url in selected.items()
+        }
+        report = {
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "debug": settings.DEBUG,
+            "user": user.email,
+            "requests": options["requests"],
+            "data": {
+                "users": User.objects.count(),
+                "recipes": Recipe.objects.count(),
+            },
+            "results": results,
+        }
+        baseline = self.load_baseline(options["compare"])
+        self.print_report(results, baseline)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f"Пользователь {email} не найден")
+            return user
+        user = (
+            User.objects.annotate(following_count=Count("follower"))
+            .order_by("-following_count", "id")
+            .first()
+        )
+        if user is None:
+            raise CommandError(
+                "Нет пользователей: выполните python manage.py generate_data"
+            )
+        return user
+
+    def measure(self, client, url, count, warmup):
+        for _ in range(warmup):
+            self.request(client, url)
+        durations, queries = [], []
+        status = None
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                status = self.request(client, url)
+                durations.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context))
+        return {
+            "url": url,
+            "status": status,
+            "p50_ms": round(percentile(durations, 0.5), 3),
+            "p95_ms": round(percentile(durations, 0.95), 3),
+            "p99_ms": round(percentile(durations, 0.99), 3),
+            "mean_ms": round(statistics.mean(durations), 3),
+            "queries": max(queries),
+            "mean_queries": round(statistics.mean(queries), 2),
+        }
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            # Потоковый ответ формируется при чтении
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+    def load_baseline(self, path):
+        if not path:
+            return {}
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)["results"]
+
+    def print_report(self, results, baseline):
+        header = f"{'сценарий':32} {'p50':>9} {'p95':>9} {'p99':>9} {'SQL':>5}"
+        self.stdout.write(header)
+        for name, result in results.items():
+            line = (
+                f"{name:32} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f}"
+                f" {result['p99_ms']:9.2f} {result['queries']:5}"
+            )
+            previous = baseline.get(name)
+            if previous:
+                line += (
+                    f"  p95 {result['p95_ms'] - previous['p95_ms']:+.2f} мс,"
+                    f" SQL {result['queries'] - previous['queries']:+d}"
+                )
+            if result["status"] >= 400:
+                line = self.style.WARNING(f"{line}  [{result['status']}]")
+            self.stdout.write(line)
@@ -0,0 +1,129 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.management.commands.benchmark import percentile
+from api.projections import RecipeProjection
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeGetSerializer
+from recipes.models import Recipe
+from users.models import User
+
+
+def serializer_page(request, limit):
+    recipes = list(Recipe.objects.for_feed(request.user)[:limit])
+    data = RecipeGetSerializer(
+        recipes, many=True, context={"request": request}
+    ).data
+    return data, JSONRenderer()
+
+
+def projection_page(request, limit):
+    projection = RecipeProjection(request)
+    queryset = projection.rows(Recipe.objects.for_feed(request.user))
+    rows = list(queryset[:limit])
+    return projection.serialize(rows), FastJSONRenderer()
+
+
+MODES = {
+    "serializer": serializer_page,
+    "projection": projection_page,
+}
+
+
+# python manage.py benchmark_serializers --limit 100 --repeat 200
+class Command(BaseCommand):
+    help = (
+        "Сравнивает выдачу страницы рецептов через RecipeGetSerializer "
+        "и через RecipeProjection: совпадение JSON и время"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100,
+                            help="Рецептов на странице")
+        parser.add_argument("--repeat", type=int, default=100)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--user", help="email пользователя; по "
+                            "умолчанию - с наибольшим числом подписок")
+        parser.add_argument("--host", default="localhost")
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError(
+                "Нет данных: выполните python manage.py generate_data"
+            )
+        request = self.get_request(options["user"], options["host"])
+        bodies = {
+            mode: self.render(page, request, options["limit"])[0]
+            for mode, page in MODES.items()
+        }
+        if bodies["serializer"] != bodies["projection"]:
+            raise CommandError("JSON сериализатора и проекции различается")
+        self.stdout.write(
+            f"JSON совпадает: {len(bodies['serializer'])} байт, "
+            f"рецептов: {options['limit']}"
+        )
+        self.stdout.write(
+            f"{'режим':12} {'p50':>9} {'p95':>9} {'сборка':>9} "
+            f"{'JSON':>9} {'SQL':>5}"
+        )
+        for mode, page in MODES.items():
+            result = self.measure(page, request, options)
+            self.stdout.write(
+                f"{mode:12} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f}"
+                f" {result['build_ms']:9.2f} {result['render_ms']:9.2f}"
+                f" {result['queries']:5}"
+            )
+
+    def get_request(self, email, host):
+        users = User.objects.all()
+        if email:
+            users = users.filter(email=email)
+        user = (
+            users.annotate(following_count=Count("follower"))
+            .order_by("-following_count", "id")
+            .first()
+        )
+        if user is None:
+            raise CommandError("Пользователь не найден")
+        request = Request(
+            APIRequestFactory().get(reverse("recipes-list"), HTTP_HOST=host)
+        )
+        request.user = user
+        return request
+
+    def render(self, page, request, limit):
+        """Тело ответа и время сборки данных и рендеринга, мс."""
+        started = time.perf_counter()
+        data, renderer = page(request, limit)
+        built = time.perf_counter()
+        body = renderer.render(data)
+        rendered = time.perf_counter()
+        return body, (built - started) * 1000, (rendered - built) * 1000
+
+    def measure(self, page, request, options):
+        for _ in range(options["warmup"]):
+            self.render(page, request, options["limit"])
+        durations, builds, renders = [], [], []
+        with CaptureQueriesContext(connection) as context:
+            self.render(page, request, options["limit"])
+        for _ in range(options["repeat"]):
+            _, build, render = self.render(page, request, options["limit"])
+            durations.append(build + render)
+            builds.append(build)
+            renders.append(render)
+        return {
+            "p50_ms": percentile(durations, 0.5),
+            "p95_ms": percentile(durations, 0.95),
+            "build_ms": statistics.mean(builds),
+            "render_ms": statistics.mean(renders),
+            "queries": len(context),
+        }
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("foodgram.slow_requests")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket", dict(labels, le=str(bound)), cumulative
+        yield f"{name}_bucket", dict(labels, le="+Inf"), self.count
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+class Registry:
+    """
+    Метрики процесса в текстовом формате Prometheus.
+    Каждый воркер gunicorn ведет свои значения; Prometheus собирает
+    их со всех процессов и суммирует при агрегации.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self.collectors = []
+
+    def observe(self, name, help_text, buckets, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.help[name] = ("histogram", help_text)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, help_text, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.help[name] = ("counter", help_text)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def register_collector(self, collector):
+        """
+        collector() возвращает [(имя, тип, описание, метки, значение)]
+        и вызывается при каждой выгрузке метрик.
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        described = set()
+
+        def describe(name, kind, help_text):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                describe(name, *self.help[name])
+                lines.append(format_sample(name, dict(labels), value))
+            for (name, labels), histogram in sorted(
+                self.histograms.items()
+            ):
+                describe(name, *self.help[name])
+                for sample in histogram.samples(name, dict(labels)):
+                    lines.append(format_sample(*sample))
+        for collector in self.collectors:
+            for name, kind, help_text, labels, value in collector():
+                describe(name, kind, help_text)
+                lines.append(format_sample(name, labels, value))
+        return "\n".join(lines) + "\n"
+
+
+def format_sample(name, labels, value):
+    if labels:
+        rendered = ",".join(
+            '{}="{}"'.format(
+                key, str(label).replace("\\", "\\\\").replace('"', '\\"')
+            )
+            for key, label in labels.items()
+        )
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы и время в БД."""
+
+    def __init__(self, keep_sql):
+        self.keep_sql = keep_sql
+        self.count = 0
+        self.duration = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if len(self.statements) < self.keep_sql:
+                self.statements.append((elapsed, sql))
+
+
+def view_label(request):
+    """RecipesViewSet.list, FollowUserViewSet.subscribe и т.п."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    view_class = getattr(match.func, "cls", None)
+    actions = getattr(match.func, "actions", None)
+    if view_class is not None and actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f"{view_class.__name__}.{action}"
+    if view_class is not None:
+        return view_class.__name__
+    return match.view_name or match.func.__name__
+
+
+class MetricsMiddleware:
+    """
+    Для каждого запроса пишет в гистограммы время ответа, время в БД,
+    число SQL-запросов и размер ответа с метками view/method.
+    Медленные запросы (METRICS["SLOW_REQUEST_SECONDS"]) попадают
+    в лог foodgram.slow_requests вместе с SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = settings.METRICS
+        recorder = QueryRecorder(options["SLOW_REQUEST_MAX_SQL"])
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(recorder)
+                )
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        labels = {"view": view_label(request), "method": request.method}
+        registry.inc(
+            "foodgram_requests_total",
+            "Число запросов",
+            dict(labels, status=str(response.status_code)),
+        )
+        registry.observe(
+            "foodgram_request_duration_seconds",
+            "Время ответа",
+            DURATION_BUCKETS,
+            labels,
+            duration,
+        )
+        registry.observe(
+            "foodgram_request_db_seconds",
+            "Время в БД за запрос",
+            DURATION_BUCKETS,
+            labels,
+            recorder.duration,
+        )
+        registry.observe(
+            "foodgram_request_queries",
+            "Число SQL-запросов за запрос",
+            QUERY_BUCKETS,
+            labels,
+            recorder.count,
+        )
+        if not response.streaming:
+            registry.observe(
+                "foodgram_response_size_bytes",
+                "Размер ответа",
+                SIZE_BUCKETS,
+                labels,
+                len(response.content),
+            )
+        if duration >= options["SLOW_REQUEST_SECONDS"]:
+            logger.warning(
+                "Медленный запрос %s %s (%s): %.3f с, БД %.3f с, "
+                "запросов %d\n%s",
+                request.method,
+                request.get_full_path(),
+                labels["view"],
+                duration,
+                recorder.duration,
+                recorder.count,
+                "\n".join(
+                    f"  {elapsed * 1000:.1f} мс: {sql}"
+                    for elapsed, sql in recorder.statements
+                ),
+            )
+        return response
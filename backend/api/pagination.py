@@ -1,6 +1,137 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PaginationWithLimit(PageNumberPagination):
     page_size = 3
     page_size_query_param = "limit"
+
+
+class RecipeCursorPagination(BasePagination):
+    """
+    Keyset-пагинация ленты рецептов по (pub_date, id).
+    Страница выбирается условием по ключу последней записи, а не OFFSET,
+    поэтому время ответа не зависит от глубины. Включается параметром
+    cursor (пустое значение - первая страница).
+    Параметр count: none (по умолчанию, без COUNT), estimate (оценка
+    планировщика Postgres) или exact. Ссылка previous не формируется:
+    клиентам с бесконечной прокруткой она не нужна.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+    count_query_param = "count"
+    page_size = PaginationWithLimit.page_size
+    max_page_size = 100
+    ordering = ("-pub_date", "-id")
+    invalid_cursor_message = "Неверный курсор"
+
+    @classmethod
+    def is_requested(cls, request):
+        return cls.cursor_query_param in request.query_params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk = base64.urlsafe_b64decode(
+                encoded.encode()
+            ).decode().split("|")
+            pub_date, pk = parse_datetime(pub_date), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def encode_cursor(self, recipe):
+        # Страница из RecipeProjection состоит из dict
+        if isinstance(recipe, dict):
+            pub_date, pk = recipe["pub_date"], recipe["id"]
+        else:
+            pub_date, pk = recipe.pub_date, recipe.pk
+        return base64.urlsafe_b64encode(
+            f"{pub_date.isoformat()}|{pk}".encode()
+        ).decode()
+
+    def estimate_count(self, queryset):
+        """
+        Оценка числа строк из плана запроса. EXPLAIN выполняется через
+        курсор: psycopg2 сам разбирает json-колонку, а QuerySet.explain()
+        склеивает строки результата через str() и портит json.
+        """
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]["Plan Rows"]
+
+    def get_count(self, queryset, mode):
+        if mode == "exact":
+            return queryset.count()
+        if (
+            mode == "estimate"
+            and connections[queryset.db].vendor == "postgresql"
+        ):
+            return self.estimate_count(queryset)
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.count = self.get_count(
+            queryset, request.query_params.get(self.count_query_param)
+        )
+        page = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            pub_date, pk = position
+            page = page.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+            )
+        recipes = list(page[:page_size + 1])
+        self.has_next = len(recipes) > page_size
+        recipes = recipes[:page_size]
+        self.last = recipes[-1] if recipes else None
+        return recipes
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.last),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.count),
+                    ("next", self.get_next_link()),
+                    ("previous", None),
+                    ("results", data),
+                ]
+            )
+        )
@@ -0,0 +1,216 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from recipes.models import DataVersion, Recipe, RecipeIngredient
+
+from .replicas import primary_reads
+
+
+def posting():
+    # Отсортированные id рецептов, 4 байта на id вместо объекта int в set
+    return array("I")
+
+
+class Ranking:
+    """
+    Результат PantryIndex.match для пагинатора. Длина известна сразу,
+    а срез сортирует только первые stop совпадений (heapq.nsmallest),
+    а не все: для первых страниц это почти линейно.
+    """
+
+    def __init__(self, keys):
+        # Ключи сортировки (не хватает, -совпало, -id рецепта)
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            if index < 0:
+                index += len(self.keys)
+            return self[index:index + 1][0]
+        start, stop, step = index.indices(len(self.keys))
+        top = heapq.nsmallest(stop, self.keys)
+        return [
+            (-recipe_id, -matched, missing)
+            for missing, matched, recipe_id in top[start:stop:step]
+        ]
+
+
+class PantryIndex:
+    """
+    Обратный индекс ингредиент -> рецепты в памяти процесса для поиска
+    "что приготовить из того, что есть".
+    Рецепты, измененные в этом процессе, помечаются сигналами
+    и перечитываются одним запросом перед следующим поиском.
+    Любое изменение рецептов меняет версию индекса в БД (DataVersion);
+    раз в SYNC_INTERVAL процесс сверяет
+    версию и, только если она изменилась, подтягивает изменения других
+    процессов по Recipe.updated_at и находит удаленные рецепты сверкой
+    id. Раз в REBUILD_INTERVAL индекс строится заново.
+    """
+
+    version_name = "pantry"
+
+    def __init__(self, options):
+        self.sync_interval = options["SYNC_INTERVAL"]
+        self.sync_overlap = timedelta(seconds=options["SYNC_OVERLAP"])
+        self.rebuild_interval = options["REBUILD_INTERVAL"]
+        self.lock = threading.Lock()
+        self.postings = defaultdict(posting)
+        # id рецепта -> id его ингредиентов
+        self.recipes = {}
+        self.built_at = None
+        self.synced_at = None
+        self.synced_version = None
+        self.checked_at = None
+        self.dirty = set()
+
+    def version(self):
+        return DataVersion.current(self.version_name).token
+
+    def invalidate(self):
+        with self.lock:
+            self.built_at = None
+
+    def build(self):
+        version = self.version()
+        synced_at = timezone.now() - self.sync_overlap
+        postings = defaultdict(posting)
+        recipes = {
+            recipe_id: posting()
+            for recipe_id in Recipe.objects.order_by("id").values_list(
+                "id", flat=True
+            )
+        }
+        rows = RecipeIngredient.objects.values_list(
+            "recipe_id", "ingredient_id"
+        ).order_by("recipe_id")
+        # Строки идут по возрастанию recipe_id: списки остаются
+        # отсортированными без сортировки
+        for recipe_id, ingredient_id in rows.iterator(chunk_size=5000):
+            if recipe_id not in recipes:
+                # Рецепт создан между двумя запросами
+                recipes[recipe_id] = posting()
+            recipes[recipe_id].append(ingredient_id)
+            ingredient_recipes = postings[ingredient_id]
+            if not ingredient_recipes or ingredient_recipes[-1] != recipe_id:
+                ingredient_recipes.append(recipe_id)
+        self.postings = postings
+        self.recipes = recipes
+        self.built_at = self.checked_at = time.monotonic()
+        self.synced_at = synced_at
+        self.synced_version = version
+
+    def put(self, recipe_id, ingredient_ids):
+        self.remove(recipe_id)
+        ingredient_ids = set(ingredient_ids)
+        self.recipes[recipe_id] = array("I", sorted(ingredient_ids))
+        for ingredient_id in ingredient_ids:
+            recipe_ids = self.postings[ingredient_id]
+            recipe_ids.insert(bisect_left(recipe_ids, recipe_id), recipe_id)
+
+    def remove(self, recipe_id):
+        for ingredient_id in self.recipes.pop(recipe_id, ()):
+            recipe_ids = self.postings[ingredient_id]
+            position = bisect_left(recipe_ids, recipe_id)
+            if (
+                position < len(recipe_ids)
+                and recipe_ids[position] == recipe_id
+            ):
+                del recipe_ids[position]
+            if not recipe_ids:
+                del self.postings[ingredient_id]
+
+    def load(self, recipe_ids):
+        """Перечитывает ингредиенты рецептов из БД."""
+        existing = set(
+            Recipe.objects.filter(pk__in=recipe_ids).values_list(
+                "id", flat=True
+            )
+        )
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=existing
+        ).values_list("recipe_id", "ingredient_id"):
+            ingredients[recipe_id].append(ingredient_id)
+        for recipe_id in recipe_ids:
+            if recipe_id in existing:
+                self.put(recipe_id, ingredients[recipe_id])
+            else:
+                self.remove(recipe_id)
+
+    def mark_dirty(self, recipe_ids):
+        """Вызывается после коммита транзакции, изменившей рецепты."""
+        with self.lock:
+            if self.built_at is not None:
+                self.dirty.update(recipe_ids)
+        DataVersion.bump(self.version_name)
+
+    def sync(self):
+        version = self.version()
+        if version != self.synced_version:
+            synced_at = timezone.now() - self.sync_overlap
+            changed = list(
+                Recipe.objects.filter(updated_at__gte=self.synced_at)
+                .order_by()
+                .values_list("id", flat=True)
+            )
+            if changed:
+                self.load(changed)
+            self.synced_at = synced_at
+            # Удаление не меняет updated_at: ищем его по числу рецептов
+            if Recipe.objects.count() != len(self.recipes):
+                existing = set(Recipe.objects.values_list("id", flat=True))
+                known = set(self.recipes)
+                for recipe_id in known - existing:
+                    self.remove(recipe_id)
+                self.load(list(existing - known))
+            self.synced_version = version
+        self.checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self.built_at is None or now - self.built_at > (
+            self.rebuild_interval
+        ):
+            self.dirty.clear()
+            self.build()
+            return
+        if self.dirty:
+            self.load(list(self.dirty))
+            self.dirty.clear()
+        if now - self.checked_at > self.sync_interval:
+            self.sync()
+
+    def match(self, ingredient_ids, max_missing=None):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов, в порядке:
+        меньше недостающих, больше совпавших, новее.
+        Возвращает Ranking из (recipe_id, совпало, не хватает).
+        """
+        # Индекс переживает запрос: читаем основную БД, а не реплику
+        with self.lock, primary_reads():
+            self.ensure_fresh()
+            matched = Counter()
+            for ingredient_id in set(ingredient_ids):
+                matched.update(self.postings.get(ingredient_id, ()))
+            keys = [
+                (len(self.recipes[recipe_id]) - count, -count, -recipe_id)
+                for recipe_id, count in matched.items()
+            ]
+        if max_missing is not None:
+            keys = [key for key in keys if key[0] <= max_missing]
+        return Ranking(keys)
+
+
+pantry_index = PantryIndex(settings.PANTRY_INDEX)
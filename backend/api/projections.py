@@ -0,0 +1,138 @@
+from collections import defaultdict
+
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
+
+from recipes.models import Recipe, RecipeIngredient
+from users.models import Follow
+
+from .fields import image_variant_urls
+
+# Поля автора в строке страницы: author_<поле>
+AUTHOR_FIELDS = ("email", "username", "first_name", "last_name")
+
+
+class RecipeProjection:
+    """
+    Выдача рецептов без RecipeGetSerializer для list и retrieve.
+    Страница читается через values() из queryset ленты (флаги
+    пользователя и поля автора - аннотациями того же запроса), теги
+    и ингредиенты - двумя values_list на всю страницу, а ответ
+    собирается из обычных dict в порядке полей сериализаторов.
+    JSON совпадает с RecipeGetSerializer байт в байт; сверка и замер -
+    python manage.py benchmark_serializers.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.storage = Recipe._meta.get_field("image").storage
+
+    def rows(self, queryset):
+        """Queryset ленты (Recipe.objects.for_feed) -> queryset строк."""
+        user = self.request.user
+        if user.is_authenticated:
+            is_subscribed = Exists(
+                Follow.objects.filter(user=user, author=OuterRef("author_id"))
+            )
+        else:
+            is_subscribed = Value(False, output_field=BooleanField())
+        return queryset.prefetch_related(None).values(
+            "id",
+            "name",
+            "image",
+            "image_variants",
+            "text",
+            "cooking_time",
+            "pub_date",
+            "updated_at",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "author_id",
+            author_is_subscribed=is_subscribed,
+            **{
+                f"author_{field}": F(f"author__{field}")
+                for field in AUTHOR_FIELDS
+            },
+        )
+
+    @staticmethod
+    def version(row):
+        """То же, что RecipesViewSet.recipes_etag берет из модели."""
+        return (
+            row["id"],
+            row["updated_at"].timestamp(),
+            row["is_favorited"],
+            row["is_in_shopping_cart"],
+            row["author_is_subscribed"],
+        )
+
+    def load_related(self, recipe_ids):
+        tags = defaultdict(list)
+        ingredients = defaultdict(list)
+        if not recipe_ids:
+            return tags, ingredients
+        # Порядок - как у prefetch_related: Tag.Meta.ordering и pk
+        for recipe_id, tag_id, name, color, slug in (
+            Recipe.tags.through.objects.filter(recipe_id__in=recipe_ids)
+            .order_by("tag__name")
+            .values_list(
+                "recipe_id", "tag_id", "tag__name", "tag__color", "tag__slug"
+            )
+        ):
+            tags[recipe_id].append(
+                {"id": tag_id, "name": name, "color": color, "slug": slug}
+            )
+        for recipe_id, ingredient_id, name, unit, amount in (
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+            .order_by("pk")
+            .values_list(
+                "recipe_id",
+                "ingredient_id",
+                "ingredient__name",
+                "ingredient__measurement_unit",
+                "amount",
+            )
+        ):
+            ingredients[recipe_id].append(
+                {
+                    "id": ingredient_id,
+                    "name": name,
+                    "measurement_unit": unit,
+                    "amount": amount,
+                }
+            )
+        return tags, ingredients
+
+    def image_url(self, name):
+        # Как ImageField DRF: абсолютный URL или None
+        if not name:
+            return None
+        return self.request.build_absolute_uri(self.storage.url(name))
+
+    def serialize(self, rows):
+        """Строки из rows() -> данные ответа RecipeGetSerializer."""
+        tags, ingredients = self.load_related([row["id"] for row in rows])
+        return [
+            {
+                "id": row["id"],
+                "tags": tags[row["id"]],
+                "author": {
+                    "email": row["author_email"],
+                    "id": row["author_id"],
+                    "username": row["author_username"],
+                    "first_name": row["author_first_name"],
+                    "last_name": row["author_last_name"],
+                    "is_subscribed": row["author_is_subscribed"],
+                },
+                "ingredients": ingredients[row["id"]],
+                "is_favorited": row["is_favorited"],
+                "is_in_shopping_cart": row["is_in_shopping_cart"],
+                "name": row["name"],
+                "image": self.image_url(row["image"]),
+                "image_variants": image_variant_urls(
+                    row["image"], row["image_variants"], self.request
+                ),
+                "text": row["text"],
+                "cooking_time": row["cooking_time"],
+            }
+            for row in rows
+        ]
@@ -0,0 +1,49 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+LINE_SEPARATORS = (
+    ("\u2028".encode(), b"\\u2028"),
+    ("\u2029".encode(), b"\\u2029"),
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson с тем же выводом, что и у DRF в компактном
+    режиме: UTF-8 без экранирования, даты и прочие типы - через
+    encoder_class DRF, U+2028/U+2029 экранируются.
+    С отступами (Accept: application/json; indent=4), при других
+    настройках DRF и для данных, которые orjson не кодирует (ключи
+    не строки, целые больше 64 бит), рендерит JSONRenderer.
+    Числа с плавающей точкой (экспоненциальную запись, NaN) orjson
+    пишет иначе, поэтому рендерер подключается только там, где их нет
+    (RecipesViewSet).
+    """
+
+    options = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            rendered = orjson.dumps(
+                data, default=self.encoder_class().default, option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        for separator, escaped in LINE_SEPARATORS:
+            rendered = rendered.replace(separator, escaped)
+        return rendered
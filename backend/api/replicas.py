@@ -0,0 +1,244 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PRIMARY = "default"
+
+# Алиас БД для чтения в текущем запросе; None - основная БД
+read_alias = ContextVar("read_alias", default=None)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Чтение внутри блока идет из основной БД. Для данных, которые
+    кладутся в общий кэш: отстающая реплика иначе закэширует
+    устаревшее состояние на весь срок жизни записи.
+    """
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+# Отставание реплики в секундах; 0, если все полученные изменения
+# уже применены (pg_last_xact_replay_timestamp на простаивающем
+# мастере стареет, хотя реплика не отстает)
+LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - "
+    "pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaRouter:
+    """
+    Чтение - с реплики, выбранной ReplicaMiddleware для запроса,
+    запись, миграции и все вне HTTP-запросов - в основную БД.
+    Модели из PRIMARY_MODELS всегда читаются из основной БД: только
+    что выданный токен или поставленная задача могут еще не дойти
+    до реплики.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label in settings.DATABASE_REPLICAS["PRIMARY_MODELS"]:
+            return PRIMARY
+        return read_alias.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему репликацией; прочие БД (например,
+        # отдельная тестовая) мигрируются как обычно
+        return db not in settings.DATABASE_REPLICAS["ALIASES"]
+
+
+class ReplicaHealth:
+    """
+    Состояние реплик: доступность и отставание. Проверяет их фоновый
+    поток раз в HEALTH_CHECK_INTERVAL секунд (запускается при первом
+    обращении в каждом процессе), запросы берут последний результат.
+    Пока проверки не было или она давно не обновлялась (поток завис
+    на подключении), реплика считается недоступной. Без интервала
+    (None) поток не запускается, проверки - только через refresh().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+        self.thread = None
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            if connection.vendor != "postgresql":
+                connection.ensure_connection()
+                return 0
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.warning("Реплика %s недоступна", alias, exc_info=True)
+            return None
+        finally:
+            connection.close()
+
+    def refresh(self):
+        """Проверяет все реплики и запоминает результат."""
+        for alias in settings.DATABASE_REPLICAS["ALIASES"]:
+            lag = self.check(alias)
+            with self.lock:
+                self.checked[alias] = (time.monotonic(), lag)
+
+    def run(self, interval):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Проверка реплик упала")
+            time.sleep(interval)
+
+    def start(self, interval):
+        with self.lock:
+            # После fork потоки родителя не работают: is_alive() - False
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(
+                target=self.run,
+                args=(interval,),
+                name="replica-health",
+                daemon=True,
+            )
+            self.thread.start()
+
+    def lag(self, alias):
+        """
+        Отставание в секундах по последней проверке или None, если
+        реплика недоступна или еще не проверялась.
+        """
+        interval = settings.DATABASE_REPLICAS["HEALTH_CHECK_INTERVAL"]
+        if interval is not None:
+            self.start(interval)
+        with self.lock:
+            entry = self.checked.get(alias)
+        if entry is None:
+            return None
+        checked_at, lag = entry
+        if interval is not None and (
+            time.monotonic() - checked_at > 3 * interval
+        ):
+            return None
+        return lag
+
+    def metrics(self):
+        with self.lock:
+            checked = dict(self.checked)
+        for alias, (_, lag) in sorted(checked.items()):
+            yield (
+                "foodgram_db_replica_up",
+                "gauge",
+                "Доступность реплики при последней проверке",
+                {"alias": alias},
+                int(lag is not None),
+            )
+            if lag is not None:
+                yield (
+                    "foodgram_db_replica_lag_seconds",
+                    "gauge",
+                    "Отставание реплики",
+                    {"alias": alias},
+                    lag,
+                )
+
+
+health = ReplicaHealth()
+registry.register_collector(health.metrics)
+
+
+def sticky_key(request, response=None):
+    """
+    Клиент определяется по заголовку Authorization (токену), без него -
+    по cookie сессии, в том числе только что выданной в response.
+    """
+    client = request.META.get("HTTP_AUTHORIZATION")
+    if not client:
+        client = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not client and response is not None:
+        cookie = response.cookies.get(settings.SESSION_COOKIE_NAME)
+        client = cookie.value if cookie is not None else None
+    if not client:
+        return None
+    digest = hashlib.sha256(client.encode()).hexdigest()
+    return f"replica:sticky:{digest}"
+
+
+def choose_replica():
+    options = settings.DATABASE_REPLICAS
+    aliases = list(options["ALIASES"])
+    random.shuffle(aliases)
+    for alias in aliases:
+        lag = health.lag(alias)
+        if lag is not None and lag <= options["MAX_LAG"]:
+            return alias
+    return None
+
+
+class ReplicaMiddleware:
+    """
+    Безопасные запросы (GET, HEAD, OPTIONS) читают с реплики.
+    После успешного изменяющего запроса клиент STICKY_SECONDS читает
+    из основной БД, чтобы видеть свои изменения (избранное, корзина,
+    подписки, рецепты). Если все реплики недоступны или отстают больше
+    MAX_LAG секунд, чтение идет из основной БД.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = settings.DATABASE_REPLICAS
+        if not options["ALIASES"]:
+            return self.get_response(request)
+        cache = caches[options["CACHE_ALIAS"]]
+        key = sticky_key(request)
+        alias = None
+        if request.method in SAFE_METHODS and not (
+            key is not None and cache.get(key)
+        ):
+            alias = choose_replica()
+        registry.inc(
+            "foodgram_db_reads_total",
+            "Запросы по БД для чтения",
+            {"alias": alias or PRIMARY},
+        )
+        token = read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return response
+        key = sticky_key(request, response)
+        if key is not None:
+            cache.set(key, True, timeout=options["STICKY_SECONDS"])
+        return response
@@ -1,19 +1,21 @@
-import base64
-
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
-from djoser.serializers import UserCreateSerializer, UserSerializer
+from django.db import transaction
+from djoser.serializers import (
+    TokenCreateSerializer,
+    UserCreateSerializer,
+    UserSerializer,
+)
+from rest_framework.authtoken.models import Token
 from rest_framework.serializers import (
     CharField,
-    ImageField,
     IntegerField,
+    ListField,
     ModelSerializer,
-    PrimaryKeyRelatedField,
     SerializerMethodField,
     UniqueTogetherValidator,
     ValidationError,
 )
 
+from jobs.models import Job
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -24,6 +26,10 @@ from recipes.models import (
 )
 from users.models import Follow, User
 
+from .authentication import expired_before
+from .fields import Base64ImageField, ImageVariantsField
+from .viewer import ViewerState
+
 # ===========================================================================
 #               User
 # ===========================================================================
@@ -47,6 +53,21 @@ class UserCreateSerializer(UserCreateSerializer):
         )
 
 
+class TokenCreateSerializer(TokenCreateSerializer):
+    """
+    Вход (Djoser): устаревший токен удаляется, чтобы login_user
+    выдал новый вместо возврата старого.
+    Переопределен в settings.
+    """
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        limit = expired_before()
+        if limit is not None:
+            Token.objects.filter(user=self.user, created__lt=limit).delete()
+        return attrs
+
+
 class UserGetSerializer(UserSerializer):
     """
     Сериализатор для получения пользователей (Djoser).
@@ -67,13 +88,13 @@ class UserGetSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, author):
-        request_user = self.context["request"].user
-        return (
-            request_user.is_authenticated
-            and Follow.objects.filter(
-                user=request_user, author=author
-            ).exists()
-        )
+        # Аннотация из Recipe.objects.for_feed() или FollowViewSet,
+        # иначе - множества id из ViewerState (без запроса на объект)
+        if hasattr(author, "is_subscribed"):
+            return author.is_subscribed
+        return ViewerState.for_request(
+            self.context["request"]
+        ).is_subscribed(author)
 
 
 # ===========================================================================
@@ -87,14 +108,15 @@ class SmallRecipeSerializer(ModelSerializer):
     Вызывается в Follow, Favorite и ShoppingList.
     """
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
 
 
 class FollowSerializer(ModelSerializer):
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
     is_subscribed = SerializerMethodField()
 
     class Meta:
@@ -110,19 +132,17 @@ class FollowSerializer(ModelSerializer):
             "recipes_count",
         )
 
-    def get_recipes_count(self, author):
-        return author.recipes.count()
-
     def get_is_subscribed(self, author):
-        request_user = self.context["request"].user
-        return (
-            request_user.is_authenticated
-            and Follow.objects.filter(
-                user=request_user, author=author
-            ).exists()
-        )
+        # Аннотации и page_recipes готовит FollowViewSet для всей страницы
+        if hasattr(author, "is_subscribed"):
+            return author.is_subscribed
+        return ViewerState.for_request(
+            self.context["request"]
+        ).is_subscribed(author)
 
     def get_recipes(self, author):
+        if hasattr(author, "page_recipes"):
+            return SmallRecipeSerializer(author.page_recipes, many=True).data
         request = self.context["request"]
         limit = request.query_params.get("recipes_limit")
         # Вернет None если нет параметра
@@ -216,6 +236,7 @@ class RecipeGetSerializer(ModelSerializer):
     )
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -228,27 +249,25 @@ class RecipeGetSerializer(ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
         )
 
     def get_is_favorited(self, recipe):
-        request_user = self.context["request"].user
-        return (
-            request_user.is_authenticated
-            and Favorite.objects.filter(
-                user=request_user, recipe=recipe
-            ).exists()
-        )
+        # Аннотации из Recipe.objects.for_feed() избавляют от запросов
+        if hasattr(recipe, "is_favorited"):
+            return recipe.is_favorited
+        return ViewerState.for_request(
+            self.context["request"]
+        ).is_favorited(recipe)
 
     def get_is_in_shopping_cart(self, recipe):
-        request_user = self.context["request"].user
-        return (
-            request_user.is_authenticated
-            and ShoppingList.objects.filter(
-                user=request_user, recipe=recipe
-            ).exists()
-        )
+        if hasattr(recipe, "is_in_shopping_cart"):
+            return recipe.is_in_shopping_cart
+        return ViewerState.for_request(
+            self.context["request"]
+        ).is_in_shopping_cart(recipe)
 
 
 class RecipeIngredientPostSerializer(ModelSerializer):
@@ -260,20 +279,16 @@ class RecipeIngredientPostSerializer(ModelSerializer):
         fields = ("id", "amount")
 
 
-class Base64ImageField(ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
-        return super().to_internal_value(data)
-
-
 class RecipePostSerializer(ModelSerializer):
+    """
+    Запись рецепта за фиксированное число запросов: ингредиенты и теги
+    проверяются одним in_bulk, связи обновляются пакетно по разнице.
+    """
+
     ingredients = RecipeIngredientPostSerializer(
         many=True, source="ingredients_in_recipes"
     )
-    tags = PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
+    tags = ListField(child=IntegerField())
     image = Base64ImageField()
 
     class Meta:
@@ -287,68 +302,95 @@ class RecipePostSerializer(ModelSerializer):
             "cooking_time",
         )
 
-    def validate(self, data):
-        for ingredient in data.get("ingredients_in_recipes"):
-            if ingredient.get("amount") <= 0:
-                raise ValidationError(
-                    {
-                        "amount": (
-                            "Количество должно быть не меньше 1"
-                        )
-                    }
-                )
-        return data
+    def validate_tags(self, tag_ids):
+        tags = Tag.objects.in_bulk(set(tag_ids))
+        missing = set(tag_ids) - set(tags)
+        if missing:
+            raise ValidationError(
+                f"Теги не найдены: {', '.join(map(str, sorted(missing)))}"
+            )
+        return list(tags.values())
 
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient["id"] for ingredient in ingredients]
+        if len(ids) != len(set(ids)):
+            raise ValidationError("Ингредиенты не должны повторяться")
+        for ingredient in ingredients:
+            if ingredient["amount"] <= 0:
+                raise ValidationError("Количество должно быть не меньше 1")
+        found = Ingredient.objects.in_bulk(ids)
+        missing = set(ids) - set(found)
+        if missing:
+            raise ValidationError(
+                "Ингредиенты не найдены: "
+                + ", ".join(map(str, sorted(missing)))
+            )
+        # Ключ - id ингредиента, значение - количество
+        return {
+            ingredient["id"]: ingredient["amount"]
+            for ingredient in ingredients
+        }
+
+    def set_ingredients(self, recipe, amounts, created=False):
+        """Удаляет, обновляет и добавляет только изменившиеся строки."""
+        existing = (
+            {}
+            if created
+            else {
+                row.ingredient_id: row
+                for row in RecipeIngredient.objects.filter(recipe=recipe)
+            }
+        )
+        removed = set(existing) - set(amounts)
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            row = existing.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ("amount",))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients = validated_data.pop("ingredients_in_recipes")
+        amounts = validated_data.pop("ingredients_in_recipes")
         tags = validated_data.pop("tags")
         author = self.context.get("request").user
 
-        # To create and save an object in a single step,
-        # use the create() method
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags)
-        for ingredient in ingredients:
-            ingredient_obj = get_object_or_404(
-                Ingredient, id=ingredient.get("id")
-            )
-            amount = ingredient.get("amount")
-            RecipeIngredient.objects.create(
-                recipe=recipe, ingredient=ingredient_obj, amount=amount
-            )
-        recipe.save()
-
+        self.set_ingredients(recipe, amounts, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-
-        new_tags = validated_data.pop("tags")
-        instance.tags.clear()
-        for tag in new_tags:
-            tag_obj = get_object_or_404(Tag, id=tag.id)
-            instance.tags.add(tag_obj)
-
-        new_ingredients = validated_data.pop("ingredients_in_recipes")
-        instance.ingredients.clear()
-        for ingredient in new_ingredients:
-            ingredient_obj = get_object_or_404(
-                Ingredient, id=ingredient.get("id")
-            )
-            amount = ingredient.get("amount")
-            instance.ingredients.add(
-                ingredient_obj, through_defaults={"amount": amount}
-            )
+        # При частичном обновлении связи могут не передаваться
+        tags = validated_data.pop("tags", None)
+        if tags is not None:
+            instance.tags.set(tags)
+        amounts = validated_data.pop("ingredients_in_recipes", None)
+        if amounts is not None:
+            self.set_ingredients(instance, amounts)
 
         # validated_data = name, image, text, cooking_time
-        super().update(instance, validated_data)
-
-        instance.save()
-        return instance
+        return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get("request")
+        recipe = Recipe.objects.for_feed(request.user).get(pk=instance.pk)
         return RecipeGetSerializer(
-            instance, context={"request": request}
+            recipe, context={"request": request}
         ).data
 
 
@@ -400,3 +442,23 @@ class ShoppingListSerializer(ModelSerializer):
         return SmallRecipeSerializer(
             recipe, context={"request": request}
         ).data
+
+
+# ===========================================================================
+#               Job
+# ===========================================================================
+
+
+class JobSerializer(ModelSerializer):
+    class Meta:
+        model = Job
+        fields = (
+            "id",
+            "name",
+            "status",
+            "attempts",
+            "result",
+            "error",
+            "created_at",
+            "finished_at",
+        )
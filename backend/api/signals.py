@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+)
+from recipes.transactions import CommitBatch
+from users.models import Follow, User
+
+from . import authentication, viewer
+from .autocomplete import ingredient_index
+from .cache import ingredients_cache, tags_cache
+from .pantry import pantry_index
+
+
+def invalidate_ingredients_now():
+    ingredient_index.invalidate()
+    ingredients_cache.invalidate()
+
+
+# Сброс после коммита: иначе параллельный запрос успеет собрать кэш
+# новой версии из еще не закоммиченных данных
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    transaction.on_commit(invalidate_ingredients_now)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(tags_cache.invalidate)
+
+
+def invalidate_viewer_on_commit(user_id, relation):
+    transaction.on_commit(lambda: viewer.invalidate(user_id, relation))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def invalidate_viewer_favorites(instance, **kwargs):
+    invalidate_viewer_on_commit(instance.user_id, "favorites")
+
+
+@receiver((post_save, post_delete), sender=ShoppingList)
+def invalidate_viewer_shopping_cart(instance, **kwargs):
+    invalidate_viewer_on_commit(instance.user_id, "shopping_cart")
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_viewer_following(instance, **kwargs):
+    invalidate_viewer_on_commit(instance.user_id, "following")
+
+
+# Одна смена версии индекса на транзакцию, а не на каждую строку
+pantry_batch = CommitBatch(pantry_index.mark_dirty)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def refresh_pantry_recipe(instance, **kwargs):
+    pantry_batch.add(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def refresh_pantry_ingredients(instance, **kwargs):
+    pantry_batch.add(instance.recipe_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    authentication.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, update_fields, **kwargs):
+    # Деактивация, смена пароля и данных профиля; вход меняет
+    # только last_login
+    if created or update_fields == frozenset(("last_login",)):
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        "key", flat=True
+    ):
+        authentication.invalidate(key)
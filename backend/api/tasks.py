@@ -0,0 +1,33 @@
+import tempfile
+import uuid
+
+from django.core.files import File
+from django.urls import reverse
+
+from jobs.registry import task
+
+from .exports import (
+    EXPORTERS,
+    collect_expired_exports,
+    export_storage,
+    shopping_cart_rows,
+)
+
+
+@task("api.export_shopping_cart", concurrency=4)
+def export_shopping_cart(job, export_format):
+    """
+    Выгрузка списка покупок в файл в EXPORTS["ROOT"]; скачивается
+    по result["url"] (/api/jobs/<id>/download/).
+    """
+    exporter = EXPORTERS[export_format]
+    with tempfile.TemporaryFile() as file:
+        for chunk in exporter.render(shopping_cart_rows(job.user)):
+            file.write(chunk.encode())
+        file.seek(0)
+        name = export_storage().save(
+            f"{uuid.uuid4().hex}.{exporter.extension}", File(file)
+        )
+    # Заодно удаляем истекшие выгрузки: отдельный cron для них не нужен
+    collect_expired_exports()
+    return {"file": name, "url": reverse("jobs-download", args=(job.pk,))}
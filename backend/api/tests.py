@@ -0,0 +1,956 @@
+import base64
+import copy
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import timedelta
+
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import authentication
+from api.autocomplete import ingredient_index
+from api.cache import tags_cache
+from api.pagination import RecipeCursorPagination
+from api.pantry import PantryIndex, pantry_index
+from api.replicas import health
+from api.viewer import ViewerState
+from jobs.models import Job
+from jobs.worker import run_pending
+
+from recipes.models import (
+    DataVersion,
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+)
+from recipes.storage import recipe_image_storage
+from users.models import Follow, User
+
+
+def create_recipes(author, count, tags, ingredients):
+    recipes = []
+    # Колбэки после коммита выполняются сразу: иначе пачка touch_batch
+    # из setUpTestData ждет конца класса и поглощает изменения тестов
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f"Рецепт {author.username} {number}",
+                text="Описание",
+                cooking_time=10,
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=2
+                )
+                for ingredient in ingredients
+            )
+            recipes.append(recipe)
+    return recipes
+
+
+class APITestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f"author{number}",
+                email=f"author{number}@example.com",
+                password="pass",
+            )
+            for number in range(10)
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f"тег{number}",
+                color=f"#00000{number}",
+                slug=f"tag{number}",
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент{number}", measurement_unit="г"
+            )
+            for number in range(5)
+        ]
+        cls.recipes = []
+        for author in cls.authors:
+            cls.recipes += create_recipes(
+                author, 3, cls.tags, cls.ingredients
+            )
+            Follow.objects.create(user=cls.user, author=author)
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        caches["default"].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_constant_queries(self, url, expected):
+        """Число запросов не зависит от размера страницы."""
+        for limit in (3, 9):
+            caches["default"].clear()
+            with self.subTest(limit=limit), self.assertNumQueries(expected):
+                response = self.client.get(url, {"limit": limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["results"]), limit)
+
+
+class QueryCountTests(APITestCase):
+    # Страница, COUNT, теги и ингредиенты одним запросом каждый
+    def test_recipe_list(self):
+        self.assert_constant_queries(reverse("recipes-list"), 4)
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_constant_queries(reverse("recipes-list"), 4)
+
+    # + prefetch авторов
+    @override_settings(RECIPE_FAST_READ=False)
+    def test_recipe_list_serializers(self):
+        self.assert_constant_queries(reverse("recipes-list"), 5)
+
+    # COUNT, авторы и их рецепты одним оконным запросом
+    def test_subscriptions(self):
+        self.assert_constant_queries(reverse("follow-list"), 3)
+
+
+class RecipeProjectionTests(APITestCase):
+    """RecipeProjection отдает тот же JSON, что RecipeGetSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        author = cls.authors[1]
+        author.first_name, author.last_name = "Имя", "Фамилия"
+        with cls.captureOnCommitCallbacks(execute=True):
+            author.save()
+            Follow.objects.filter(user=cls.user, author=author).delete()
+        recipe = cls.recipes[4]
+        recipe.image = "recipe_images/" + "a" * 64 + ".png"
+        recipe.image_variants = {
+            "source": recipe.image.name,
+            "variants": {
+                "card": {
+                    "webp": "recipe_images/variants/card.webp",
+                    "jpeg": "recipe_images/variants/card.jpeg",
+                }
+            },
+        }
+        # Картинка без построенных копий
+        other = cls.recipes[5]
+        other.image = "recipe_images/" + "b" * 64 + ".png"
+        Recipe.objects.bulk_update(
+            [recipe, other], ("image", "image_variants")
+        )
+
+    def fetch(self, url, fast_read):
+        caches["default"].clear()
+        with override_settings(RECIPE_FAST_READ=fast_read):
+            response = self.client.get(url, {"limit": 100})
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def assert_same(self, url):
+        projected = self.fetch(url, True)
+        self.assertEqual(projected, self.fetch(url, False))
+        return json.loads(projected)
+
+    def check(self):
+        data = self.assert_same(reverse("recipes-list"))
+        self.assertEqual(len(data["results"]), len(self.recipes))
+        for recipe in self.recipes[3:6]:
+            with self.subTest(recipe=recipe.pk):
+                self.assert_same(
+                    reverse("recipes-detail", args=(recipe.pk,))
+                )
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.check()
+
+    def test_authenticated(self):
+        data = self.assert_same(
+            reverse("recipes-detail", args=(self.recipes[4].pk,))
+        )
+        # Сверка имеет смысл: поля, которые собирает проекция, заполнены
+        self.assertTrue(data["is_favorited"])
+        self.assertFalse(data["author"]["is_subscribed"])
+        self.assertEqual(data["author"]["first_name"], "Имя")
+        self.assertIn("card", data["image_variants"])
+        self.check()
+
+
+class ReferenceCacheTests(APITestCase):
+    url = reverse("tags-list")
+
+    def test_tags_invalidated_after_commit(self):
+        self.assertEqual(len(self.client.get(self.url).json()), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name="новый", color="#FFFFFF", slug="new")
+            # До коммита кэш отдает прежнюю версию
+            self.assertEqual(len(self.client.get(self.url).json()), 3)
+        self.assertEqual(len(self.client.get(self.url).json()), 4)
+
+    def test_version_outlives_process_cache(self):
+        etag = self.client.get(self.url)["ETag"]
+        caches["default"].clear()
+        tags_cache.local.clear()
+        self.assertEqual(self.client.get(self.url)["ETag"], etag)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidation_from_other_process(self):
+        etag = self.client.get(self.url)["ETag"]
+        # Команда load в другом процессе: bulk_create без сигналов
+        # и смена версии в БД, локальный кэш этого процесса не тронут
+        Tag.objects.bulk_create(
+            [Tag(name="новый", color="#FFFFFF", slug="new")]
+        )
+        DataVersion.bump(tags_cache.version_name)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 4)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class CursorPaginationTests(APITestCase):
+    url = reverse("recipes-list")
+
+    def test_walk_covers_feed_once(self):
+        response = self.client.get(self.url, {"cursor": "", "limit": 7})
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertIsNone(page["count"])
+            ids += [recipe["id"] for recipe in page["results"]]
+            if page["next"] is None:
+                break
+            response = self.client.get(page["next"])
+        self.assertEqual(
+            ids,
+            list(
+                Recipe.objects.order_by("-pub_date", "-id").values_list(
+                    "id", flat=True
+                )
+            ),
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in ("???", "bm90LWEtY3Vyc29y", "eHw1"):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_count_modes(self):
+        for mode, expected in (
+            (None, None),
+            ("exact", len(self.recipes)),
+            # Оценка есть только у PostgreSQL
+            ("estimate", None),
+        ):
+            with self.subTest(mode=mode):
+                params = {"cursor": ""}
+                if mode:
+                    params["count"] = mode
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.json()["count"], expected)
+
+    def test_estimate_reads_plan_rows(self):
+        connection = connections["default"]
+        plan = [{"Plan": {"Plan Rows": 42}}]
+        # psycopg2 отдает json-колонку списком, другие драйверы - строкой
+        for row in (plan, json.dumps(plan)):
+            cursor = mock.MagicMock()
+            cursor.__enter__.return_value.fetchone.return_value = (row,)
+            with self.subTest(row=type(row).__name__), mock.patch.object(
+                connection, "vendor", "postgresql"
+            ), mock.patch.object(connection, "cursor", return_value=cursor):
+                count = RecipeCursorPagination().get_count(
+                    Recipe.objects.all(), "estimate"
+                )
+            self.assertEqual(count, 42)
+            sql, _ = cursor.__enter__.return_value.execute.call_args[0]
+            self.assertTrue(sql.startswith("EXPLAIN (FORMAT JSON) SELECT"))
+
+
+class ViewerStateTests(APITestCase):
+    def assert_toggled(self, relation, object_id, method, url):
+        def flag():
+            return object_id in ViewerState(self.user).ids(relation)
+
+        before = flag()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.generic(method, url)
+            self.assertIn(response.status_code, (201, 204), response.content)
+            # До коммита в кэше остается прежнее состояние: иначе
+            # параллельный запрос успел бы закэшировать незакоммиченное
+            self.assertEqual(flag(), before)
+        self.assertEqual(flag(), not before)
+
+    def test_favorite(self):
+        recipe = self.recipes[1]
+        url = reverse("recipes-favorite", args=(recipe.pk,))
+        for method in ("POST", "DELETE"):
+            self.assert_toggled("favorites", recipe.pk, method, url)
+
+    def test_shopping_cart(self):
+        recipe = self.recipes[1]
+        url = reverse("recipes-shopping-cart", args=(recipe.pk,))
+        for method in ("POST", "DELETE"):
+            self.assert_toggled("shopping_cart", recipe.pk, method, url)
+
+    def test_follow(self):
+        author = self.authors[0]
+        url = reverse("users_follow-subscribe", args=(author.pk,))
+        for method in ("DELETE", "POST"):
+            self.assert_toggled("following", author.pk, method, url)
+        response = self.client.get(
+            reverse("users_follow-detail", args=(author.pk,))
+        )
+        self.assertTrue(response.json()["is_subscribed"])
+
+
+class RecipeFilterTests(APITestCase):
+    url = reverse("recipes-list")
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.special = Tag.objects.create(
+            name="особый", color="#FFFFFF", slug="special"
+        )
+        cls.special.recipe_set.add(*cls.recipes[:4])
+
+    def ids(self, **params):
+        response = self.client.get(self.url, {"limit": 100, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(recipe["id"] for recipe in response.json()["results"])
+
+    def expected(self, recipes):
+        return sorted(recipe.pk for recipe in recipes)
+
+    def test_tags(self):
+        self.assertEqual(
+            self.ids(tags="special"), self.expected(self.recipes[:4])
+        )
+        # Рецепт с двумя подходящими тегами - один раз
+        self.assertEqual(
+            self.ids(tags=["special", "tag0"]), self.expected(self.recipes)
+        )
+
+    def test_user_relations(self):
+        for param in ("is_favorited", "is_in_shopping_cart"):
+            with self.subTest(param=param):
+                self.assertEqual(
+                    self.ids(**{param: 1}), self.expected(self.recipes[::2])
+                )
+                self.assertEqual(
+                    self.ids(**{param: 0}), self.expected(self.recipes[1::2])
+                )
+
+    def test_user_relations_anonymous(self):
+        self.client.force_authenticate(None)
+        for param in ("is_favorited", "is_in_shopping_cart"):
+            with self.subTest(param=param):
+                self.assertEqual(self.ids(**{param: 1}), [])
+                self.assertEqual(
+                    self.ids(**{param: 0}), self.expected(self.recipes)
+                )
+
+    def test_author(self):
+        author = self.authors[1]
+        self.assertEqual(
+            self.ids(author=author.pk),
+            self.expected(author.recipes.all()),
+        )
+
+    def test_combined(self):
+        self.assertEqual(
+            self.ids(
+                tags="special",
+                is_favorited=1,
+                is_in_shopping_cart=1,
+                author=self.authors[0].pk,
+            ),
+            self.expected(self.recipes[0:3:2]),
+        )
+
+
+class RecipeSearchTests(APITestCase):
+    url = reverse("recipes-list")
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        in_name, in_text = cls.recipes[3], cls.recipes[7]
+        in_name.name = "Борщ с пампушками"
+        in_text.text = "Подается к борщу и супам"
+        with cls.captureOnCommitCallbacks(execute=True):
+            in_name.save()
+            in_text.save()
+        cls.in_name, cls.in_text = in_name, in_text
+
+    def ids(self, search):
+        response = self.client.get(
+            self.url, {"limit": 100, "search": search}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return [recipe["id"] for recipe in response.json()["results"]]
+
+    @skipUnless(connection.vendor == "sqlite", "Запасной поиск без Postgres")
+    def test_substring_fallback(self):
+        # Регистр кириллицы SQLite различает, ранжирования нет
+        self.assertEqual(self.ids("борщ"), [self.in_text.pk])
+        self.assertEqual(self.ids("Борщ"), [self.in_name.pk])
+        self.assertEqual(self.ids("пампушк"), [self.in_name.pk])
+        self.assertEqual(self.ids("нет такого"), [])
+        # Пустой запрос не фильтрует
+        self.assertEqual(len(self.ids("  ")), len(self.recipes))
+
+    def test_postgres_query_ranks_by_relevance(self):
+        with mock.patch.object(connection, "vendor", "postgresql"):
+            queryset = Recipe.objects.search("борщ -суп")
+        settings_dict = copy.deepcopy(connection.settings_dict)
+        settings_dict["ENGINE"] = "django.db.backends.postgresql"
+        sql, params = queryset.query.get_compiler(
+            connection=DatabaseWrapper(settings_dict, alias="postgresql")
+        ).as_sql()
+        self.assertIn(
+            '"recipes_recipe"."search_vector" @@ '
+            "websearch_to_tsquery(%s::regconfig, %s)",
+            sql,
+        )
+        self.assertIn("ts_rank(", sql)
+        self.assertTrue(
+            sql.endswith(
+                'ORDER BY "search_rank" DESC, '
+                '"recipes_recipe"."pub_date" DESC, '
+                '"recipes_recipe"."id" DESC'
+            ),
+            sql,
+        )
+        self.assertIn("russian", params)
+        self.assertIn("борщ -суп", params)
+
+    @skipUnless(connection.vendor == "postgresql", "Нужен PostgreSQL")
+    def test_postgres_title_match_ranks_first(self):
+        self.assertEqual(
+            self.ids("борщ"), [self.in_name.pk, self.in_text.pk]
+        )
+        self.assertEqual(self.ids("борщ -пампушки"), [self.in_text.pk])
+
+
+class RecipeWriteTests(APITestCase):
+    # Чтение рецепта, проверки, запись ингредиентов и ответ; после
+    # коммита один UPDATE сдвигает updated_at и один - версию PantryIndex
+    PATCH_QUERIES = 17
+
+    def test_patch_queries_do_not_depend_on_removed_ingredients(self):
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"запас{number}", measurement_unit="г"
+            )
+            for number in range(12)
+        ]
+        for recipe, keep in zip(self.recipes, (10, 2)):
+            with self.captureOnCommitCallbacks(execute=True):
+                RecipeIngredient.objects.filter(recipe=recipe).delete()
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(
+                        recipe=recipe, ingredient=ingredient, amount=1
+                    )
+                    for ingredient in ingredients
+                )
+            self.client.force_authenticate(recipe.author)
+            with self.subTest(removed=12 - keep), self.assertNumQueries(
+                self.PATCH_QUERIES
+            ), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    reverse("recipes-detail", args=(recipe.pk,)),
+                    {
+                        "ingredients": [
+                            {"id": ingredient.pk, "amount": 3}
+                            for ingredient in ingredients[:keep]
+                        ]
+                    },
+                    format="json",
+                )
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(len(response.json()["ingredients"]), keep)
+
+
+class RecipeImageTests(APITestCase):
+    url = reverse("recipes-list")
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(
+            MEDIA_ROOT=directory.name,
+            JOBS={"ENABLED": True, "HEARTBEAT_INTERVAL": 30},
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def image(self, size=(600, 400), image_format="PNG"):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "red").save(buffer, image_format)
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f"data:image/{image_format.lower()};base64,{encoded}"
+
+    def create(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                self.url,
+                {
+                    "name": "С картинкой",
+                    "text": "Описание",
+                    "cooking_time": 5,
+                    "tags": [self.tags[0].pk],
+                    "ingredients": [
+                        {"id": self.ingredients[0].pk, "amount": 1}
+                    ],
+                    "image": image,
+                },
+                format="json",
+            )
+
+    def test_variants_built_for_valid_image(self):
+        response = self.create(self.image())
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIsNone(response.json()["image_variants"])
+        self.assertEqual(run_pending(), 1)
+        recipe = Recipe.objects.get(pk=response.json()["id"])
+        response = self.client.get(
+            reverse("recipes-detail", args=(recipe.pk,))
+        )
+        variants = response.json()["image_variants"]
+        self.assertEqual(set(variants), set(settings.RECIPE_IMAGE_VARIANTS))
+        for variant, (width, height) in (
+            settings.RECIPE_IMAGE_VARIANTS.items()
+        ):
+            formats = recipe.image_variants["variants"][variant]
+            self.assertEqual(set(formats), {"webp", "jpeg"})
+            self.assertTrue(
+                variants[variant]["webp"].endswith(formats["webp"])
+            )
+            with recipe_image_storage.open(formats["jpeg"]) as file:
+                size = Image.open(file).size
+            self.assertLessEqual(size[0], width)
+            self.assertLessEqual(size[1], height)
+
+    def test_oversized_image_rejected(self):
+        image = self.image()
+        with override_settings(RECIPE_IMAGE_MAX_SIZE=100):
+            response = self.create(image)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("image", response.json())
+        self.assertFalse(Recipe.objects.filter(name="С картинкой").exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_invalid_image_rejected(self):
+        for image in (
+            "data:image/png;base64,не base64",
+            "data:image/bmp;base64,AAAA",
+            "data:image/png;base64," + base64.b64encode(b"text").decode(),
+        ):
+            with self.subTest(image=image[:24]):
+                response = self.create(image)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("image", response.json())
+
+
+class AutocompleteTests(APITestCase):
+    url = reverse("ingredients-autocomplete")
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for name in ("молоко сгущенное", "молоко", "кокосовое молоко"):
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def setUp(self):
+        super().setUp()
+        ingredient_index.invalidate()
+        self.addCleanup(ingredient_index.invalidate)
+
+    def names(self, name, **params):
+        response = self.client.get(self.url, {"name": name, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item["name"] for item in response.json()]
+
+    def check_prefix(self):
+        # Точное совпадение первым, затем продолжения
+        self.assertEqual(
+            self.names(" Молоко ")[:2], ["молоко", "молоко сгущенное"]
+        )
+        self.assertEqual(self.names("мо", limit=1), ["молоко"])
+        self.assertEqual(self.names(""), [])
+
+    def test_prefix(self):
+        self.check_prefix()
+        # После совпадений по началу - вхождения (или триграммы)
+        self.assertEqual(self.names("молоко")[2:], ["кокосовое молоко"])
+
+    @override_settings(INGREDIENT_AUTOCOMPLETE_IN_MEMORY=True)
+    def test_prefix_in_memory(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.check_prefix()
+        # Ингредиенты читаются один раз - при построении индекса
+        reads = [
+            query["sql"]
+            for query in queries
+            if '"recipes_ingredient"' in query["sql"]
+        ]
+        self.assertEqual(len(reads), 1, reads)
+
+    @skipUnless(connection.vendor == "sqlite", "Запасной поиск без Postgres")
+    def test_misspelling_without_trigrams(self):
+        # Без pg_trgm остается поиск подстроки: опечатку он не находит
+        self.assertEqual(self.names("малоко"), [])
+
+    @override_settings(INGREDIENT_AUTOCOMPLETE_IN_MEMORY=True)
+    def test_misspelling_in_memory(self):
+        self.assertEqual(self.names("малоко")[:1], ["молоко"])
+
+    @skipUnless(connection.vendor == "postgresql", "Нужен pg_trgm")
+    def test_misspelling_with_trigrams(self):
+        self.assertIn("молоко", self.names("малоко"))
+
+
+class ShoppingCartExportTests(APITestCase):
+    url = reverse("recipes-download-shopping-cart")
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        exports = override_settings(EXPORTS={"ROOT": self.root, "TTL": 60})
+        exports.enable()
+        self.addCleanup(exports.disable)
+
+    def export(self):
+        response = self.client.get(
+            self.url, {"background": 1, "export_format": "csv"}
+        )
+        self.assertEqual(response.status_code, 202)
+        run_pending()
+        return Job.objects.get(pk=response.json()["id"])
+
+    @override_settings(JOBS={"ENABLED": False})
+    def test_without_worker_exports_synchronously(self):
+        response = self.client.get(self.url, {"background": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS={"ENABLED": True, "HEARTBEAT_INTERVAL": 30})
+    def test_download_only_by_owner(self):
+        job = self.export()
+        self.assertEqual(job.status, Job.DONE, job.error)
+        self.assertEqual(
+            job.result["url"], reverse("jobs-download", args=(job.pk,))
+        )
+        self.assertEqual(os.listdir(self.root), [job.result["file"]])
+        response = self.client.get(job.result["url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("shopping_cart.csv", response["Content-Disposition"])
+        self.assertTrue(b"".join(response.streaming_content))
+        self.client.force_authenticate(self.authors[0])
+        self.assertEqual(self.client.get(job.result["url"]).status_code, 404)
+
+    @override_settings(JOBS={"ENABLED": True, "HEARTBEAT_INTERVAL": 30})
+    def test_expired_export_removed(self):
+        job = self.export()
+        path = os.path.join(self.root, job.result["file"])
+        expired = timezone.now() - timedelta(seconds=61)
+        Job.objects.filter(pk=job.pk).update(finished_at=expired)
+        self.assertEqual(self.client.get(job.result["url"]).status_code, 404)
+        os.utime(path, (expired.timestamp(), expired.timestamp()))
+        # Следующая выгрузка удаляет истекшие файлы
+        fresh = self.export()
+        self.assertEqual(os.listdir(self.root), [fresh.result["file"]])
+
+
+class PantryIndexTests(APITestCase):
+    options = {
+        "SYNC_INTERVAL": 0,
+        "SYNC_OVERLAP": 30,
+        "REBUILD_INTERVAL": 60 * 60,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Рецепты с 1-5 первыми ингредиентами
+        for size in range(1, 6):
+            (recipe,) = create_recipes(
+                cls.authors[0], 1, cls.tags, cls.ingredients[:size]
+            )
+            cls.recipes.append(recipe)
+
+    def expected(self, matched_ids):
+        """Полная сортировка совпадений, как до Ranking."""
+        ranked = []
+        for recipe in self.recipes:
+            ingredient_ids = {
+                ingredient.pk for ingredient in recipe.ingredients.all()
+            }
+            matched = len(ingredient_ids & set(matched_ids))
+            if matched:
+                ranked.append(
+                    (recipe.pk, matched, len(ingredient_ids) - matched)
+                )
+        return sorted(ranked, key=lambda item: (item[2], -item[1], -item[0]))
+
+    def test_pages_match_full_sort(self):
+        matched_ids = [self.ingredients[0].pk, self.ingredients[1].pk]
+        ranking = PantryIndex(self.options).match(matched_ids)
+        expected = self.expected(matched_ids)
+        self.assertEqual(len(ranking), len(expected))
+        self.assertEqual(ranking[0:len(ranking)], expected)
+        self.assertEqual(ranking[3:6], expected[3:6])
+        self.assertEqual(ranking[-1], expected[-1])
+
+    def test_cookable(self):
+        pantry_index.invalidate()
+        self.addCleanup(pantry_index.invalidate)
+        response = self.client.get(
+            reverse("recipes-cookable"),
+            {"ingredients": self.ingredients[0].pk, "limit": 3, "page": 2},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (
+                    recipe["id"],
+                    recipe["matched_ingredients"],
+                    recipe["missing_ingredients"],
+                )
+                for recipe in response.json()["results"]
+            ],
+            self.expected([self.ingredients[0].pk])[3:6],
+        )
+
+    def test_sync_reads_database_only_after_version_change(self):
+        index = PantryIndex(self.options)
+        ingredient_ids = [self.ingredients[0].pk]
+        before = len(index.match(ingredient_ids))
+        # Версия не менялась: только чтение DataVersion
+        with self.assertNumQueries(1):
+            index.match(ingredient_ids)
+        # Удаление в другом процессе: коммит там меняет версию
+        self.recipes[-1].delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(index.match(ingredient_ids)), before)
+        DataVersion.bump(index.version_name)
+        self.assertEqual(len(index.match(ingredient_ids)), before - 1)
+
+
+class TokenCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        authentication.local_cache.clear()
+        token = Token.objects.create(user=self.user)
+        self.entry_key = authentication.cache_key(token.key)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def test_password_hash_not_cached(self):
+        response = self.client.get(reverse("users_follow-me"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["username"], self.user.username)
+        for entry in (
+            authentication.local_cache.get(self.entry_key),
+            caches["default"].get(self.entry_key),
+        ):
+            fields, _ = entry
+            self.assertEqual(set(fields), set(authentication.CACHED_FIELDS))
+            self.assertNotIn(self.user.password, repr(entry))
+
+    def test_me_served_from_cache(self):
+        User.objects.filter(pk=self.user.pk).update(
+            first_name="Иван", last_name="Петров"
+        )
+        url = reverse("users_follow-me")
+        expected = self.client.get(url).json()
+        self.assertEqual(expected["first_name"], "Иван")
+        self.assertEqual(expected["last_name"], "Петров")
+        # Токен, пользователь и его подписки - из кэша
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.json(), expected)
+
+    def test_cached_user_checks_password(self):
+        self.client.get(reverse("users_follow-me"))
+        response = self.client.post(
+            reverse("users_follow-set-password"),
+            {"current_password": "pass", "new_password": "Nq8-long-pass"},
+        )
+        self.assertEqual(response.status_code, 204, response.content)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("Nq8-long-pass"))
+
+
+@override_settings(
+    DATABASE_REPLICAS=dict(settings.DATABASE_REPLICAS, ALIASES=["replica"])
+)
+class ReplicaRoutingTests(TestCase):
+    databases = {"default", "replica"}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        cls.author = User.objects.create_user(
+            username="primary", email="primary@example.com", password="pass"
+        )
+        # Реплика "отстает": на ней только читатель и свой пользователь
+        User.objects.using("replica").create(
+            pk=cls.user.pk, username="reader", email="reader@example.com"
+        )
+        User.objects.using("replica").create(
+            username="replica", email="replica@example.com"
+        )
+
+    def setUp(self):
+        caches["default"].clear()
+        health.checked.clear()
+        self.addCleanup(health.checked.clear)
+        health.refresh()
+        self.client = APIClient()
+        # Сессия определяет клиента для чтения из основной БД
+        self.client.force_login(self.user)
+        self.client.force_authenticate(self.user)
+
+    def usernames(self):
+        response = self.client.get(reverse("users_follow-list"))
+        self.assertEqual(response.status_code, 200)
+        return {user["username"] for user in response.json()["results"]}
+
+    def test_safe_requests_read_replica(self):
+        self.assertIn("replica", self.usernames())
+
+    def test_unsafe_requests_read_primary(self):
+        # Автор есть только в основной БД
+        response = self.client.post(
+            reverse("users_follow-subscribe", args=(self.author.pk,))
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_reads_stick_to_primary_after_write(self):
+        self.client.post(
+            reverse("users_follow-subscribe", args=(self.author.pk,))
+        )
+        self.assertIn("primary", self.usernames())
+        # Другой клиент по-прежнему читает реплику
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = "other"
+        self.assertIn("replica", self.usernames())
+
+    def test_failed_replica_falls_back_to_primary(self):
+        with mock.patch.object(health, "check", return_value=None):
+            health.refresh()
+        self.assertIn("primary", self.usernames())
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        lag = settings.DATABASE_REPLICAS["MAX_LAG"] + 1
+        with mock.patch.object(health, "check", return_value=lag):
+            health.refresh()
+        self.assertIn("primary", self.usernames())
+
+    def test_cache_filled_from_primary(self):
+        Tag.objects.create(name="тег", color="#000000", slug="tag")
+        response = self.client.get(reverse("tags-list"))
+        self.assertEqual([tag["slug"] for tag in response.json()], ["tag"])
+
+
+class MetricsTests(APITestCase):
+    url = reverse("metrics")
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(
+            username="admin",
+            email="admin@example.com",
+            password="pass",
+            is_staff=True,
+        )
+
+    def scrape(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode()
+
+    def sample(self, metrics, name):
+        match = re.search(rf"^{re.escape(name)} (\S+)$", metrics, re.M)
+        return float(match.group(1)) if match else 0
+
+    def test_request_recorded(self):
+        # Метки выводятся по алфавиту, le гистограммы - последней
+        labels = 'method="GET",view="TagViewSet.list"'
+        names = (
+            'foodgram_requests_total{method="GET",status="200",'
+            'view="TagViewSet.list"}',
+            f"foodgram_request_queries_count{{{labels}}}",
+            f'foodgram_request_duration_seconds_bucket{{{labels},le="+Inf"}}',
+        )
+        before = self.scrape()
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse("tags-list"))
+        self.assertEqual(response.status_code, 200)
+        metrics = self.scrape()
+        self.assertIn("# TYPE foodgram_requests_total counter", metrics)
+        self.assertIn(
+            "# TYPE foodgram_request_duration_seconds histogram", metrics
+        )
+        for name in names:
+            self.assertEqual(
+                self.sample(metrics, name), self.sample(before, name) + 1
+            )
+
+    def test_admin_only(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.scrape()
+
+    @override_settings(
+        METRICS={"SLOW_REQUEST_SECONDS": 0, "SLOW_REQUEST_MAX_SQL": 1}
+    )
+    def test_slow_request_logged(self):
+        with self.assertLogs("foodgram.slow_requests", "WARNING") as logs:
+            self.client.get(reverse("recipes-list"))
+        (message,) = logs.output
+        self.assertIn("RecipesViewSet.list", message)
+        self.assertEqual(message.count(" мс: "), 1)
@@ -5,6 +5,8 @@ from .views import (
     FollowUserViewSet,
     FollowViewSet,
     IngredientsViewSet,
+    JobViewSet,
+    MetricsView,
     RecipesViewSet,
     TagViewSet,
 )
@@ -15,8 +17,10 @@ router_v1.register("users", FollowUserViewSet, basename="users_follow")
 router_v1.register("ingredients", IngredientsViewSet, basename="ingredients")
 router_v1.register("tags", TagViewSet, basename="tags")
 router_v1.register("recipes", RecipesViewSet, basename="recipes")
+router_v1.register("jobs", JobViewSet, basename="jobs")
 
 urlpatterns = [
+    path("metrics/", MetricsView.as_view(), name="metrics"),
     path("", include(router_v1.urls)),
     path("", include("djoser.urls")),
     path("auth/", include("djoser.urls.authtoken")),
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from recipes.models import Favorite, ShoppingList
+from users.models import Follow
+
+from .replicas import primary_reads
+
+# Отношение -> (модель, поле с id объекта)
+RELATIONS = {
+    "favorites": (Favorite, "recipe_id"),
+    "shopping_cart": (ShoppingList, "recipe_id"),
+    "following": (Follow, "author_id"),
+}
+
+
+def cache_key(user_id, relation):
+    return f"viewer:{user_id}:{relation}"
+
+
+def invalidate(user_id, relation):
+    """Вызывается при записи в Favorite, ShoppingList или Follow."""
+    caches[settings.VIEWER_STATE_CACHE["ALIAS"]].delete(
+        cache_key(user_id, relation)
+    )
+
+
+class ViewerState:
+    """
+    Избранное, корзина и подписки текущего пользователя.
+    Каждое множество id загружается один раз за запрос (одним запросом
+    к БД или из кэша пользователя), дальше флаги is_favorited,
+    is_in_shopping_cart и is_subscribed считаются без обращения к БД.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.loaded = {}
+
+    @classmethod
+    def for_request(cls, request):
+        # Храним на HttpRequest, чтобы вложенные сериализаторы
+        # с разными контекстами делили одно состояние
+        http_request = getattr(request, "_request", request)
+        state = getattr(http_request, "viewer_state", None)
+        if state is None or state.user != request.user:
+            state = cls(request.user)
+            http_request.viewer_state = state
+        return state
+
+    def ids(self, relation):
+        if not self.user.is_authenticated:
+            return frozenset()
+        if relation not in self.loaded:
+            cache = caches[settings.VIEWER_STATE_CACHE["ALIAS"]]
+            key = cache_key(self.user.pk, relation)
+            ids = cache.get(key)
+            if ids is None:
+                model, field = RELATIONS[relation]
+                with primary_reads():
+                    ids = frozenset(
+                        model.objects.filter(user=self.user).values_list(
+                            field, flat=True
+                        )
+                    )
+                cache.set(
+                    key, ids, timeout=settings.VIEWER_STATE_CACHE["TTL"]
+                )
+            self.loaded[relation] = ids
+        return self.loaded[relation]
+
+    def is_favorited(self, recipe):
+        return recipe.pk in self.ids("favorites")
+
+    def is_in_shopping_cart(self, recipe):
+        return recipe.pk in self.ids("shopping_cart")
+
+    def is_subscribed(self, author):
+        return author.pk in self.ids("following")
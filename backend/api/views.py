@@ -1,7 +1,28 @@
-from django.db.models import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import (
+    BooleanField,
+    Exists,
+    OuterRef,
+    Prefetch,
+    Value,
+)
+from django.db.models.query import prefetch_related_objects
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
 from django_filters.rest_framework import (
     BooleanFilter,
+    CharFilter,
     DjangoFilterBackend,
     FilterSet,
     ModelMultipleChoiceFilter,
@@ -9,30 +30,55 @@ from django_filters.rest_framework import (
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated,
+)
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from jobs import registry as jobs
+from jobs.models import Job
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingList,
     Tag,
 )
 from users.models import Follow, User
 
+from .autocomplete import search_ingredients
+from .cache import (
+    ReferenceCacheMixin,
+    conditional_response,
+    ingredients_cache,
+    make_etag,
+    tags_cache,
+)
+from .exports import EXPORTERS, export_storage, shopping_cart_rows
+from .metrics import registry
+from .pagination import RecipeCursorPagination
+from .pantry import pantry_index
 from .permissions import CustomPermission
+from .projections import RecipeProjection
+from .renderers import FastJSONRenderer
 from .serializers import (
     FavoriteSerializer,
     FollowCreateDeleteSerializer,
     FollowSerializer,
     IngredientsSerializer,
+    JobSerializer,
     RecipeGetSerializer,
     RecipePostSerializer,
     ShoppingListSerializer,
+    SmallRecipeSerializer,
     TagSerializer,
 )
 
@@ -45,7 +91,40 @@ class FollowViewSet(ReadOnlyModelViewSet):
     serializer_class = FollowSerializer
 
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        )
+
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get("recipes_limit")
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            return None
+        return limit if limit >= 0 else None
+
+    def paginate_queryset(self, queryset):
+        """
+        Рецепты всех авторов страницы загружаются одним оконным запросом
+        (не больше recipes_limit на автора).
+        """
+        page = super().paginate_queryset(queryset)
+        if page is None:
+            return None
+        prefetch_related_objects(
+            page,
+            Prefetch(
+                "recipes",
+                queryset=Recipe.objects.first_per_author(
+                    [author.id for author in page],
+                    self.get_recipes_limit(),
+                ),
+                to_attr="page_recipes",
+            ),
+        )
+        return page
 
 
 class FollowUserViewSet(UserViewSet):
@@ -74,27 +153,52 @@ class FollowUserViewSet(UserViewSet):
 # ===========================================================================
 
 
-class IngredientFilter(SearchFilter):
-    """Фильтр для поиска ингредиента по имени."""
+class IngredientFilter(BaseFilterBackend):
+    """
+    Фильтр для поиска ингредиента по началу имени.
+    Имена хранятся в lowercase (NameField), поэтому вместо ILIKE
+    используется LIKE 'x%' по индексу с varchar_pattern_ops.
+    """
     search_param = "name"
 
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, "").strip()
+        if not name:
+            return queryset
+        return queryset.filter(name__startswith=name.lower())
+
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
+    reference_cache = ingredients_cache
     queryset = Ingredient.objects.all()
     serializer_class = IngredientsSerializer
     permission_classes = (AllowAny,)
     filter_backends = (IngredientFilter,)
     pagination_class = None
-    search_fields = [
-        "^name",
-    ]
+
+    @action(detail=False, methods=["get"], name="Autocomplete")
+    def autocomplete(self, request, *args, **kwargs):
+        """
+        Подсказки для редактора рецепта: сначала совпадения по началу
+        имени, затем похожие (с опечатками); не больше limit штук.
+        """
+        try:
+            limit = int(request.query_params.get("limit", ""))
+        except ValueError:
+            limit = settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        limit = min(max(limit, 1), settings.INGREDIENT_AUTOCOMPLETE_MAX_LIMIT)
+        name = request.query_params.get("name", "")
+        return self.cached_response(
+            request, lambda: search_ingredients(name, limit)
+        )
 
 # ===========================================================================
 #               Tags
 # ===========================================================================
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
+    reference_cache = tags_cache
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
@@ -106,28 +210,72 @@ class TagViewSet(ReadOnlyModelViewSet):
 
 
 class RecipeFilterSet(FilterSet):
-    """Доп. фильтр для рецептов."""
+    """
+    Доп. фильтр для рецептов.
+    Каждый фильтр дополняет полученный queryset подзапросом, без JOIN
+    и DISTINCT, поэтому фильтры сочетаются в любом порядке и сохраняют
+    аннотации ленты. is_favorited=1 и is_in_shopping_cart=1 - это
+    pk IN (id рецептов пользователя): выборку ведет короткий список
+    пользователя, а не перебор всех рецептов с EXISTS на каждый.
+    Исключения (=0) и теги - EXISTS / NOT EXISTS по индексам.
+    search - полнотекстовый поиск по названию и описанию; выдача
+    сортируется по релевантности (при cursor - по дате).
+    """
     is_favorited = BooleanFilter(method="get_is_favorited")
     is_in_shopping_cart = BooleanFilter(method="get_is_in_shopping_cart")
     tags = ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
-        field_name="tags__slug",
         to_field_name="slug",
+        method="get_tags",
     )
+    search = CharFilter(method="get_search")
 
     class Meta:
         model = Recipe
-        fields = ("is_favorited", "is_in_shopping_cart", "author", "tags")
+        fields = (
+            "is_favorited",
+            "is_in_shopping_cart",
+            "author",
+            "tags",
+            "search",
+        )
+
+    def filter_user_relation(self, queryset, model, value):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        # Использует уникальный индекс (user, recipe)
+        related = model.objects.filter(user=user)
+        if value:
+            return queryset.filter(pk__in=related.values("recipe_id"))
+        return queryset.filter(
+            ~Exists(related.filter(recipe=OuterRef("pk")))
+        )
 
     def get_is_favorited(self, queryset, name, value):
-        if value is True:
-            return Recipe.objects.filter(favorites__user=self.request.user)
-        return Recipe.objects.exclude(favorites__user=self.request.user)
+        return self.filter_user_relation(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value is True:
-            return Recipe.objects.filter(shoppinglist__user=self.request.user)
-        return Recipe.objects.exclude(shoppinglist__user=self.request.user)
+        return self.filter_user_relation(queryset, ShoppingList, value)
+
+    def get_tags(self, queryset, name, tags):
+        if not tags:
+            return queryset
+        # Рецепт с несколькими подходящими тегами попадет в выдачу один раз
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef("pk"),
+                    tag_id__in=[tag.id for tag in tags],
+                )
+            )
+        )
+
+    def get_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
 
 
 class RecipesViewSet(ModelViewSet):
@@ -136,12 +284,203 @@ class RecipesViewSet(ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete"]
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilterSet
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    @property
+    def paginator(self):
+        """С параметром cursor лента отдается keyset-пагинацией."""
+        if not hasattr(self, "_paginator"):
+            if self.action == "list" and RecipeCursorPagination.is_requested(
+                self.request
+            ):
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+    def get_queryset(self):
+        if self.action in ("retrieve", "list"):
+            return Recipe.objects.for_feed(self.request.user)
+        return Recipe.objects.all()
+
+    def get_projection(self):
+        """
+        RecipeProjection для list и retrieve (RECIPE_FAST_READ):
+        страница - строки values(), а не экземпляры Recipe.
+        """
+        if settings.RECIPE_FAST_READ and self.action in ("retrieve", "list"):
+            return RecipeProjection(self.request)
+        return None
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        projection = self.get_projection()
+        if projection is None:
+            return queryset
+        return projection.rows(queryset)
+
+    def represent(self, recipes):
+        projection = self.get_projection()
+        if projection is None:
+            return self.get_serializer(recipes, many=True).data
+        return projection.serialize(recipes)
+
+    def recipes_etag(self, recipes, *extra):
+        """
+        ETag зависит от версии рецептов и от флагов текущего
+        пользователя (избранное, корзина, подписка на автора).
+        """
+        return make_etag(
+            self.request.user.pk,
+            *extra,
+            *(
+                RecipeProjection.version(recipe)
+                if isinstance(recipe, dict)
+                else (
+                    recipe.pk,
+                    recipe.updated_at.timestamp(),
+                    recipe.is_favorited,
+                    recipe.is_in_shopping_cart,
+                    recipe.author.is_subscribed,
+                )
+                for recipe in recipes
+            ),
+        )
+
+    def finalize_conditional(self, response, etag, last_modified=None):
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """Страница вычисляется до сериализации; 304 - без нее."""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = page if page is not None else list(queryset)
+        # count из ответа пагинатора тоже входит в ETag
+        paginator = getattr(
+            getattr(self.paginator, "page", None), "paginator", self.paginator
+        )
+        etag = self.recipes_etag(
+            recipes,
+            request.get_full_path(),
+            getattr(paginator, "count", len(recipes)),
+        )
+        response = conditional_response(request, etag)
+        if response is None:
+            data = self.represent(recipes)
+            if page is not None:
+                response = self.get_paginated_response(data)
+            else:
+                response = Response(data)
+        return self.finalize_conditional(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        etag = self.recipes_etag((recipe,))
+        updated_at = (
+            recipe["updated_at"] if isinstance(recipe, dict)
+            else recipe.updated_at
+        )
+        last_modified = updated_at.timestamp()
+        # If-Modified-Since не учитывает флаги пользователя, поэтому
+        # для авторизованных проверяется только ETag
+        response = conditional_response(
+            request,
+            etag,
+            None if request.user.is_authenticated else last_modified,
+        )
+        if response is None:
+            response = Response(self.represent([recipe])[0])
+        return self.finalize_conditional(response, etag, last_modified)
 
     def get_serializer_class(self):
         if self.action in ("retrieve", "list"):
             return RecipeGetSerializer
         return RecipePostSerializer
 
+    def get_pantry_params(self):
+        params = self.request.query_params
+        try:
+            ingredient_ids = {
+                int(value)
+                for values in params.getlist("ingredients")
+                for value in values.split(",")
+                if value.strip()
+            }
+        except ValueError:
+            raise ValidationError(
+                {"ingredients": "Ожидаются id ингредиентов"}
+            )
+        if not ingredient_ids:
+            raise ValidationError(
+                {"ingredients": "Укажите хотя бы один ингредиент"}
+            )
+        max_ingredients = settings.PANTRY_INDEX["MAX_INGREDIENTS"]
+        if len(ingredient_ids) > max_ingredients:
+            raise ValidationError(
+                {"ingredients": f"Не больше {max_ingredients} ингредиентов"}
+            )
+        max_missing = params.get("max_missing")
+        if max_missing is not None:
+            try:
+                max_missing = int(max_missing)
+            except ValueError:
+                max_missing = -1
+            if max_missing < 0:
+                raise ValidationError(
+                    {"max_missing": "Ожидается неотрицательное число"}
+                )
+        return ingredient_ids, max_missing
+
+    @action(detail=False, methods=["get"], name="Cook from ingredients")
+    def cookable(self, request, *args, **kwargs):
+        """
+        Что приготовить из имеющихся ингредиентов
+        (ingredients=1&ingredients=2 или ingredients=1,2).
+        Сначала рецепты, для которых есть все, затем - с наименьшим
+        числом недостающих; max_missing ограничивает это число.
+        Ранжирование идет по обратному индексу в памяти (api/pantry.py),
+        из БД читается только страница.
+        """
+        ingredient_ids, max_missing = self.get_pantry_params()
+        ranked = pantry_index.match(ingredient_ids, max_missing)
+        page = self.paginate_queryset(ranked)
+        recipes = Recipe.objects.for_feed(request.user).in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        # Рецепт могли удалить после последней синхронизации индекса
+        page = [item for item in page if item[0] in recipes]
+        data = RecipeGetSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page],
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+        for item, (_, matched, missing) in zip(data, page):
+            item["matched_ingredients"] = matched
+            item["missing_ingredients"] = missing
+        return self.get_paginated_response(data)
+
+    @action(detail=True, methods=["get"], name="Similar recipes")
+    def similar(self, request, *args, **kwargs):
+        """
+        Похожие рецепты по составу и общему избранному, от самых
+        похожих. Рассчитываются заранее: python manage.py build_similar.
+        """
+        recipe = get_object_or_404(Recipe, id=kwargs["pk"])
+        similar = (
+            Recipe.objects.filter(similar_to__recipe=recipe)
+            .defer("search_vector")
+            .order_by("-similar_to__score", "-id")
+        )
+        return Response(
+            SmallRecipeSerializer(
+                similar, many=True, context=self.get_serializer_context()
+            ).data
+        )
+
     @action(detail=True, methods=["post"], name="Create favorite")
     def favorite(self, request, *args, **kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs["pk"])
@@ -193,24 +532,96 @@ class RecipesViewSet(ModelViewSet):
         ],
     )
     def download_shopping_cart(self, request, *args, **kwargs):
-        shopping_list = (
-            RecipeIngredient.objects.filter(
-                recipe__shoppinglist__user=request.user
+        """
+        Потоковая выгрузка списка покупок.
+        Формат задается параметром export_format: txt (по умолчанию),
+        csv или json. С background=1 (и запущенным воркером runjobs)
+        выгрузка ставится в очередь, ответ 202 содержит задачу
+        (/api/jobs/<id>/) со ссылкой на файл.
+        """
+        export_format = request.query_params.get("export_format", "txt")
+        exporter = EXPORTERS.get(export_format)
+        if exporter is None:
+            raise ValidationError(
+                {
+                    "export_format": (
+                        "Допустимые форматы: " + ", ".join(EXPORTERS)
+                    )
+                }
+            )
+        if (
+            request.query_params.get("background") in ("1", "true")
+            and jobs.enabled()
+        ):
+            job = jobs.enqueue(
+                "api.export_shopping_cart",
+                user=request.user,
+                export_format=export_format,
             )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
-            .order_by()
-        )
-
-        result = [
-            "Список покупок:\n",
-        ]
-        for ingredient in shopping_list:
-            string = " ".join(str(i) for i in list(ingredient.values()))
-            result.append(f"\n{string}")
-
-        response = HttpResponse(result, content_type="text/plain")
-        response[
-            "Content-Disposition"
-        ] = 'attachment; filename="shopping_cart.txt"'
+            response = Response(
+                JobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+            )
+            response["Location"] = reverse(
+                "jobs-detail", args=(job.pk,), request=request
+            )
+            return response
+        response = StreamingHttpResponse(
+            exporter.render(shopping_cart_rows(request.user)),
+            content_type=exporter.content_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_cart.{exporter.extension}"'
+        )
         return response
+
+
+# ===========================================================================
+#               Jobs
+# ===========================================================================
+
+
+class JobViewSet(ReadOnlyModelViewSet):
+    """Статус фоновых задач текущего пользователя."""
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        return self.request.user.jobs.all()
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, *args, **kwargs):
+        """Файл выгрузки задачи; доступен EXPORTS["TTL"] после завершения."""
+        job = self.get_object()
+        if job.status != Job.DONE or not (job.result or {}).get("file"):
+            raise Http404
+        name = job.result["file"]
+        exporter = EXPORTERS.get(os.path.splitext(name)[1][1:])
+        expires = job.finished_at + timedelta(seconds=settings.EXPORTS["TTL"])
+        storage = export_storage()
+        if (
+            exporter is None
+            or expires < timezone.now()
+            or not storage.exists(name)
+        ):
+            raise Http404
+        return FileResponse(
+            storage.open(name),
+            as_attachment=True,
+            filename=f"shopping_cart.{exporter.extension}",
+            content_type=exporter.content_type,
+        )
+
+
+# ===========================================================================
+#               Metrics
+# ===========================================================================
+
+
+class MetricsView(APIView):
+    """Метрики процесса в формате Prometheus (только для админов)."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            registry.render(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -0,0 +1,45 @@
+from django.contrib import admin, messages
+from django.db import transaction
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """
+    Changelist для больших таблиц: без COUNT(*) по всей таблице
+    и с пакетным удалением вместо delete_selected, которое строит
+    страницу подтверждения со всеми связанными объектами.
+    """
+
+    show_full_result_count = False
+    list_per_page = 50
+    actions = ("delete_in_batches",)
+    delete_batch_size = 1000
+    # Для полей NameField (хранятся в lowercase): поиск идет по терму
+    # в lowercase, и "поле__startswith" превращается в LIKE 'x%',
+    # который использует индекс с varchar_pattern_ops. "^поле"
+    # (istartswith, UPPER(поле) LIKE) такой индекс не использует
+    lowercase_search_term = False
+
+    def get_search_results(self, request, queryset, search_term):
+        if self.lowercase_search_term:
+            search_term = search_term.lower()
+        return super().get_search_results(request, queryset, search_term)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(description="Удалить выбранные", permissions=("delete",))
+    def delete_in_batches(self, request, queryset):
+        pks = list(queryset.order_by().values_list("pk", flat=True))
+        deleted = 0
+        for start in range(0, len(pks), self.delete_batch_size):
+            with transaction.atomic():
+                deleted += self.model.objects.filter(
+                    pk__in=pks[start:start + self.delete_batch_size]
+                ).delete()[1].get(self.model._meta.label, 0)
+        self.message_user(
+            request,
+            f"Удалено объектов: {deleted}",
+            messages.SUCCESS,
+        )
@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+
+from django.core.signals import setting_changed
+from django.db import OperationalError
+from django.db.backends.postgresql import base, creation
+from django.dispatch import receiver
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+DEFAULT_POOL = {
+    # Соединений на процесс (на алиас БД)
+    "MAX_SIZE": 10,
+    # Сколько ждать свободного соединения, секунды
+    "TIMEOUT": 5,
+    # Простоявшее дольше соединение перед выдачей проверяется SELECT 1
+    "HEALTH_CHECK_AFTER": 30,
+    # Соединение старше этого закрывается и открывается заново
+    "MAX_LIFETIME": 30 * 60,
+}
+STATS = (
+    "checkouts",
+    "waits",
+    "wait_seconds",
+    "timeouts",
+    "created",
+    "reconnects",
+)
+
+
+class ConnectionPool:
+    """
+    Пул соединений psycopg2 одного процесса для одного алиаса БД.
+    Размер ограничен семафором: если все MAX_SIZE соединений заняты,
+    поток ждет до TIMEOUT секунд, затем получает OperationalError.
+    """
+
+    def __init__(self, alias, options):
+        self.alias = alias
+        self.options = options
+        self.closed = False
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(options["MAX_SIZE"])
+        self.idle = []
+        self.in_use = 0
+        self.created_at = {}
+        self.stats = dict.fromkeys(STATS, 0)
+        self.pid = os.getpid()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def acquire_slot(self):
+        if self.slots.acquire(blocking=False):
+            return
+        self.count("waits")
+        started = time.monotonic()
+        acquired = self.slots.acquire(timeout=self.options["TIMEOUT"])
+        self.count("wait_seconds", time.monotonic() - started)
+        if not acquired:
+            self.count("timeouts")
+            raise OperationalError(
+                "Нет свободных соединений с БД: все "
+                f"{self.options['MAX_SIZE']} заняты дольше "
+                f"{self.options['TIMEOUT']} с"
+            )
+
+    def is_usable(self, connection, returned_at):
+        if connection.closed:
+            return False
+        now = time.monotonic()
+        created_at = self.created_at.get(id(connection), now)
+        if now - created_at > self.options["MAX_LIFETIME"]:
+            return False
+        if now - returned_at < self.options["HEALTH_CHECK_AFTER"]:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def discard(self, connection):
+        self.created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def checkout(self, connect):
+        self.acquire_slot()
+        try:
+            while True:
+                with self.lock:
+                    entry = self.idle.pop() if self.idle else None
+                if entry is None:
+                    connection = connect()
+                    self.created_at[id(connection)] = time.monotonic()
+                    self.count("created")
+                    break
+                connection, returned_at = entry
+                if self.is_usable(connection, returned_at):
+                    break
+                self.count("reconnects")
+                self.discard(connection)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.in_use += 1
+            self.stats["checkouts"] += 1
+        return connection
+
+    def checkin(self, connection):
+        try:
+            if (
+                not self.closed
+                and not connection.closed
+                and connection.get_transaction_status()
+                != TRANSACTION_STATUS_IDLE
+            ):
+                connection.rollback()
+        except Exception:
+            self.discard(connection)
+        else:
+            # Пул закрыт close_all(), пока соединение было выдано
+            if connection.closed or self.closed:
+                self.discard(connection)
+            else:
+                with self.lock:
+                    self.idle.append((connection, time.monotonic()))
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self.slots.release()
+
+    def close(self):
+        """Закрывает свободные соединения; выданные закроются при возврате."""
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(
+                self.stats,
+                idle=len(self.idle),
+                in_use=self.in_use,
+                max_size=self.options["MAX_SIZE"],
+            )
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def pool_key(settings_dict):
+    """Пул общий для алиасов с одной и той же БД и параметрами входа."""
+    return (
+        settings_dict["ENGINE"],
+        settings_dict["NAME"],
+        settings_dict["HOST"],
+        str(settings_dict["PORT"]),
+        settings_dict["USER"],
+        repr(sorted(settings_dict["OPTIONS"].items())),
+    )
+
+
+def get_pool(alias, settings_dict):
+    key = pool_key(settings_dict)
+    with pools_lock:
+        pool = pools.get(key)
+        # После fork соединения родителя использовать нельзя
+        if pool is None or pool.pid != os.getpid():
+            pool = pools[key] = ConnectionPool(
+                alias, dict(DEFAULT_POOL, **settings_dict.get("POOL", {}))
+            )
+        return pool
+
+
+def close_all():
+    """
+    Закрывает все пулы процесса. Вызывается, когда соединения с прежней
+    БД больше не нужны: создание и удаление тестовой БД, изменение
+    DATABASES (override_settings).
+    """
+    with pools_lock:
+        closing = list(pools.values())
+        pools.clear()
+    for pool in closing:
+        pool.close()
+
+
+@receiver(setting_changed)
+def close_pools_on_databases_change(setting, **kwargs):
+    if setting == "DATABASES":
+        close_all()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """
+    Тестовая БД: соединения с рабочей БД и с тестовой не остаются
+    в пулах (DROP DATABASE не выполнится, пока они открыты).
+    """
+
+    def create_test_db(self, *args, **kwargs):
+        self.connection.close()
+        close_all()
+        try:
+            return super().create_test_db(*args, **kwargs)
+        finally:
+            close_all()
+
+    def destroy_test_db(self, *args, **kwargs):
+        self.connection.close()
+        close_all()
+        super().destroy_test_db(*args, **kwargs)
+        close_all()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL с пулом соединений в процессе.
+    close() в конце запроса возвращает соединение в пул, а connect()
+    берет его оттуда без нового TCP-подключения и аутентификации.
+    Настройки - DATABASES[alias]["POOL"] (см. DEFAULT_POOL).
+    """
+
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        # Соединение возвращается в тот пул, из которого взято, даже
+        # если с тех пор изменились настройки или пулы закрыты
+        self.connection_pool = get_pool(self.alias, self.settings_dict)
+        return self.connection_pool.checkout(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.connection_pool.checkin(self.connection)
+
+
+def pool_metrics():
+    """Сборщик метрик для api.metrics.registry."""
+    with pools_lock:
+        current = sorted(pools.values(), key=lambda pool: pool.alias)
+    for pool in current:
+        snapshot = pool.snapshot()
+        labels = {"alias": pool.alias}
+        for name, help_text in (
+            ("checkouts", "Выдано соединений из пула"),
+            ("waits", "Ожиданий свободного соединения"),
+            ("wait_seconds", "Суммарное время ожидания соединения"),
+            ("timeouts", "Отказов по таймауту ожидания"),
+            ("created", "Открыто новых соединений"),
+            ("reconnects", "Соединений, не прошедших проверку"),
+        ):
+            yield (
+                f"foodgram_db_pool_{name}_total",
+                "counter",
+                help_text,
+                labels,
+                snapshot[name],
+            )
+        for name, help_text in (
+            ("idle", "Свободных соединений в пуле"),
+            ("in_use", "Занятых соединений"),
+            ("max_size", "Размер пула"),
+        ):
+            yield (
+                f"foodgram_db_pool_{name}",
+                "gauge",
+                help_text,
+                labels,
+                snapshot[name],
+            )
@@ -20,15 +20,19 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "djoser",
     "api",
     "recipes",
     "users",
+    "jobs",
 ]
 
 MIDDLEWARE = [
+    "api.metrics.MetricsMiddleware",
+    "api.replicas.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -60,15 +64,93 @@ WSGI_APPLICATION = "foodgram.wsgi.application"
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # PostgreSQL с пулом соединений (foodgram/postgresql_pool)
+        'ENGINE': 'foodgram.postgresql_pool',
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django_user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Соединение возвращается в пул в конце каждого запроса
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        },
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+            'HEALTH_CHECK_AFTER': 30,
+            'MAX_LIFETIME': 30 * 60,
+        },
+    }
+}
+
+# Реплики только для чтения: DB_REPLICA_HOSTS=replica1,replica2:5433
+# (остальные параметры подключения - как у default)
+for number, address in enumerate(
+    filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), start=1
+):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica_{number}"] = dict(
+        DATABASES["default"],
+        HOST=host,
+        PORT=port or DATABASES["default"]["PORT"],
+        TEST={"MIRROR": "default"},
+    )
+
+DATABASE_ROUTERS = ["api.replicas.ReplicaRouter"]
+# Маршрутизация чтения (api/replicas.py)
+DATABASE_REPLICAS = {
+    "ALIASES": [alias for alias in DATABASES if alias != "default"],
+    # Сколько секунд после изменяющего запроса клиент читает из default
+    "STICKY_SECONDS": int(os.getenv("DB_REPLICA_STICKY_SECONDS", 10)),
+    # Реплика с большим отставанием (секунды) не используется
+    "MAX_LAG": float(os.getenv("DB_REPLICA_MAX_LAG", 5)),
+    # Реплики проверяет фоновый поток процесса раз в столько секунд
+    "HEALTH_CHECK_INTERVAL": 5,
+    "CACHE_ALIAS": "default",
+    # Модели, которые всегда читаются из default
+    "PRIMARY_MODELS": (
+        "authtoken.Token",
+        "jobs.Job",
+        "recipes.DataVersion",
+    ),
+}
+
+# Общий кэш процессов. По умолчанию - память процесса; для нескольких
+# воркеров задайте FileBasedCache (CACHE_LOCATION - каталог) или
+# совместимый с Redis бэкенд.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "foodgram"),
     }
 }
 
+# Кэш справочников (теги, ингредиенты): локальный LRU + общий CACHES
+REFERENCE_CACHE = {
+    "ALIAS": "default",
+    "LOCAL_TTL": 60,
+    "LOCAL_MAX_ENTRIES": 256,
+    "SHARED_TTL": 60 * 60,
+}
+
+# Кэш избранного, корзины и подписок пользователя (api/viewer.py);
+# сбрасывается сигналами при записи в Favorite, ShoppingList и Follow
+VIEWER_STATE_CACHE = {
+    "ALIAS": "default",
+    "TTL": 5 * 60,
+}
+
+# Метрики запросов: /api/metrics/ (Prometheus, только для админов)
+METRICS = {
+    "SLOW_REQUEST_SECONDS": float(os.getenv("SLOW_REQUEST_SECONDS", 1)),
+    # Сколько SQL-запросов медленного запроса писать в лог
+    "SLOW_REQUEST_MAX_SQL": 50,
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -102,6 +184,53 @@ STATIC_ROOT = BASE_DIR / "collected_static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "/media"
 
+# Картинки рецептов: предел размера и уменьшенные копии (ширина, высота)
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv("RECIPE_IMAGE_MAX_SIZE", 5 * 1024 * 1024)
+)
+RECIPE_IMAGE_FORMATS = ("jpeg", "jpg", "png", "gif", "webp")
+RECIPE_IMAGE_VARIANTS = {
+    "thumbnail": (160, 160),
+    "card": (480, 360),
+    "full": (1280, 1280),
+}
+RECIPE_IMAGE_WORKERS = 2
+# Файл, сохраненный или загруженный повторно за это время (секунды),
+# не удаляется: на него может ссылаться незакоммиченная транзакция
+RECIPE_IMAGE_GC_GRACE = 60 * 60
+
+# Похожие рецепты (recipes/similarity.py, python manage.py build_similar)
+SIMILAR_RECIPES = {
+    "TOP_K": 10,
+    # Вклад общих ингредиентов и общего избранного в сходство
+    "INGREDIENT_WEIGHT": 0.7,
+    "FAVORITE_WEIGHT": 0.3,
+    # Ингредиенты, которые есть в большей доле рецептов (соль, вода),
+    # не учитываются
+    "MAX_INGREDIENT_SHARE": 0.2,
+    "CHUNK_SIZE": 200,
+}
+
+# Фоновые задачи (приложение jobs, воркер: python manage.py runjobs).
+# Без воркера тяжелая работа выполняется в процессе веб-сервера.
+JOBS = {
+    "ENABLED": os.getenv("JOBS_ENABLED", "false").lower() == "true",
+    "CONCURRENCY": 4,
+    "POLL_INTERVAL": 1,
+    "RETRY_DELAY": 10,
+    # Воркер отмечает выполняемую задачу раз в HEARTBEAT_INTERVAL;
+    # задача без отметки дольше STALE_AFTER считается брошенной
+    "HEARTBEAT_INTERVAL": 30,
+    "STALE_AFTER": 5 * 60,
+}
+
+# Выгрузки списка покупок в фоне: отдаются только владельцу через
+# /api/jobs/<id>/download/ (не через /media/) и живут TTL секунд
+EXPORTS = {
+    "ROOT": os.getenv("EXPORTS_ROOT", "/exports"),
+    "TTL": 24 * 60 * 60,
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
@@ -109,13 +238,28 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticated",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PAGINATION_CLASS": "api.pagination.PaginationWithLimit",
 }
 
 AUTH_USER_MODEL = "users.User"
 
+# Кэш токенов аутентификации (api/authentication.py)
+TOKEN_AUTH = {
+    "LOCAL_TTL": 30,
+    "LOCAL_MAX_ENTRIES": 10000,
+    # Общий уровень кэша (алиас из CACHES) или None
+    "SHARED_ALIAS": os.getenv("TOKEN_AUTH_SHARED_ALIAS", "default") or None,
+    "SHARED_TTL": 5 * 60,
+    # Срок действия токена в секундах; None - бессрочно
+    "EXPIRES_AFTER": (
+        int(os.getenv("TOKEN_EXPIRES_AFTER"))
+        if os.getenv("TOKEN_EXPIRES_AFTER")
+        else None
+    ),
+}
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "HIDE_USERS": False,
@@ -123,9 +267,35 @@ DJOSER = {
         "user_create": "api.serializers.UserCreateSerializer",
         "user": "api.serializers.UserGetSerializer",
         "current_user": "api.serializers.UserGetSerializer",
+        "token_create": "api.serializers.TokenCreateSerializer",
     },
     "PERMISSIONS": {
         "user": ["djoser.permissions.CurrentUserOrAdminOrReadOnly"],
         "user_list": ["rest_framework.permissions.AllowAny"],
     },
 }
+
+# Подсказки ингредиентов: /api/ingredients/autocomplete/?name=...
+INGREDIENT_AUTOCOMPLETE_LIMIT = 10
+INGREDIENT_AUTOCOMPLETE_MAX_LIMIT = 50
+# Отвечать из префиксного индекса в памяти процесса, без запросов к БД
+INGREDIENT_AUTOCOMPLETE_IN_MEMORY = (
+    os.getenv("INGREDIENT_AUTOCOMPLETE_IN_MEMORY", "false").lower() == "true"
+)
+INGREDIENT_AUTOCOMPLETE_INDEX_TTL = 300
+
+# Поиск рецептов по имеющимся ингредиентам (api/pantry.py)
+PANTRY_INDEX = {
+    # Как часто сверять версию индекса в общем кэше (REFERENCE_CACHE)
+    # и подтягивать изменения других процессов, секунды
+    "SYNC_INTERVAL": 5,
+    # Запас на транзакции, закоммиченные позже начала синхронизации
+    "SYNC_OVERLAP": 30,
+    "REBUILD_INTERVAL": 60 * 60,
+    "MAX_INGREDIENTS": 50,
+}
+
+# Выдача рецептов через values() без RecipeGetSerializer (api/projections.py)
+RECIPE_FAST_READ = (
+    os.getenv("RECIPE_FAST_READ", "true").lower() == "true"
+)
@@ -0,0 +1,30 @@
+# Настройки для тестов: python manage.py test --settings=foodgram.settings_test
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASE_REPLICAS
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test.sqlite3",
+    },
+    # Отдельная БД, а не зеркало default: тесты маршрутизации видят,
+    # откуда прочитаны данные
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test_replica.sqlite3",
+    },
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "foodgram-tests",
+    }
+}
+
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+# Чтение с реплики включают тесты маршрутизации (api/tests.py)
+DATABASE_REPLICAS = dict(
+    DATABASE_REPLICAS, ALIASES=[], HEALTH_CHECK_INTERVAL=None
+)
@@ -0,0 +1,222 @@
+import copy
+from unittest import mock
+
+from django.contrib import admin
+from django.core.signals import setting_changed
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from api.tests import create_recipes
+from jobs.models import Job
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+)
+from users.models import Follow, User
+
+from .postgresql_pool import base as pool
+
+
+class AdminChangelistTests(TestCase):
+    # Сессия, пользователь, COUNT страницы и сама страница; + варианты
+    # фильтров (теги, статусы) или COUNT всей таблицы у ModelAdmin
+    QUERIES = {
+        "auth.Group": 5,
+        "authtoken.TokenProxy": 5,
+        "jobs.Job": 5,
+        "recipes.Favorite": 4,
+        "recipes.Ingredient": 5,
+        "recipes.Recipe": 5,
+        "recipes.RecipeIngredient": 4,
+        "recipes.ShoppingList": 4,
+        "recipes.Tag": 5,
+        "users.Follow": 4,
+        "users.User": 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pass"
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f"тег{number}",
+                color=f"#00000{number}",
+                slug=f"tag{number}",
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент{number}", measurement_unit="г"
+            )
+            for number in range(5)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        """По count строк (примерно) в каждой таблице из админки."""
+        for number in range(count):
+            user = User.objects.create_user(
+                username=f"user{User.objects.count()}",
+                email=f"user{User.objects.count()}@example.com",
+                password="pass",
+            )
+            (recipe,) = create_recipes(user, 1, self.tags, self.ingredients)
+            Follow.objects.create(user=self.admin, author=user)
+            Favorite.objects.create(user=user, recipe=recipe)
+            ShoppingList.objects.create(user=user, recipe=recipe)
+            Job.objects.create(name="api.export_shopping_cart", user=user)
+
+    def assert_changelist_queries(self):
+        for model in admin.site._registry:
+            url = reverse(
+                f"admin:{model._meta.app_label}_"
+                f"{model._meta.model_name}_changelist"
+            )
+            with self.subTest(model=model._meta.label), self.assertNumQueries(
+                self.QUERIES[model._meta.label]
+            ):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_changelist_queries_do_not_depend_on_rows(self):
+        self.assertEqual(
+            set(self.QUERIES),
+            {model._meta.label for model in admin.site._registry},
+        )
+        self.add_rows(2)
+        self.assert_changelist_queries()
+        self.add_rows(10)
+        self.assert_changelist_queries()
+
+    def search(self, model, term):
+        """
+        Результат поиска админки и его SQL для PostgreSQL: запрос
+        компилируется без подключения к серверу.
+        """
+        request = RequestFactory().get("/")
+        request.user = self.admin
+        queryset, _ = admin.site._registry[model].get_search_results(
+            request, model.objects.all(), term
+        )
+        settings = copy.deepcopy(connection.settings_dict)
+        settings["ENGINE"] = "django.db.backends.postgresql"
+        sql, _ = queryset.query.get_compiler(
+            connection=DatabaseWrapper(settings, alias="postgresql")
+        ).as_sql()
+        return queryset, sql
+
+    def test_ingredient_search_uses_prefix_index(self):
+        prefix_like = '"recipes_ingredient"."name"::text LIKE'
+        ingredients, sql = self.search(Ingredient, "Ингредиент1")
+        self.assertEqual(list(ingredients), [self.ingredients[1]])
+        self.assertIn(prefix_like, sql)
+        self.assertNotIn("UPPER", sql)
+        _, sql = self.search(RecipeIngredient, "Ингредиент1")
+        self.assertIn(prefix_like, sql)
+
+    def test_author_search_matches_username_index(self):
+        # Выражение индекса user_username_upper_idx
+        _, sql = self.search(Recipe, "Admin")
+        self.assertIn('UPPER("users_user"."username"::text) LIKE', sql)
+
+
+class FakeConnection:
+    """Соединение psycopg2 для пула: помнит, к какой БД открыто."""
+
+    def __init__(self, params):
+        self.name = params["database"]
+        self.closed = 0
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        pool.close_all()
+        self.addCleanup(pool.close_all)
+        patcher = mock.patch.object(
+            pool.base.DatabaseWrapper,
+            "get_new_connection",
+            lambda wrapper, params: FakeConnection(params),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.wrapper = self.make_wrapper()
+
+    def make_wrapper(self):
+        # У каждого потока свой DatabaseWrapper
+        return pool.DatabaseWrapper(
+            {
+                "ENGINE": "foodgram.postgresql_pool",
+                "NAME": "foodgram",
+                "USER": "django_user",
+                "PASSWORD": "",
+                "HOST": "db",
+                "PORT": 5432,
+                "OPTIONS": {},
+                "CONN_MAX_AGE": 0,
+                "TIME_ZONE": None,
+                "AUTOCOMMIT": True,
+                "ATOMIC_REQUESTS": False,
+            },
+            alias="pooled",
+        )
+
+    def open(self, wrapper):
+        params = wrapper.get_connection_params()
+        wrapper.connection = wrapper.get_new_connection(params)
+        return wrapper.connection
+
+    def close(self, wrapper):
+        wrapper._close()
+        wrapper.connection = None
+
+    def test_connection_reused(self):
+        first = self.open(self.wrapper)
+        self.close(self.wrapper)
+        self.assertIs(self.open(self.wrapper), first)
+
+    def test_reopen_after_name_change(self):
+        first = self.open(self.wrapper)
+        self.close(self.wrapper)
+        self.wrapper.settings_dict["NAME"] = "test_foodgram"
+        second = self.open(self.wrapper)
+        self.assertEqual(second.name, "test_foodgram")
+        self.close(self.wrapper)
+        self.assertIs(self.open(self.wrapper), second)
+        self.assertFalse(first.closed)
+        pool.close_all()
+        self.assertTrue(first.closed)
+
+    def test_databases_change_closes_pools(self):
+        other = self.make_wrapper()
+        idle = self.open(self.wrapper)
+        in_use = self.open(other)
+        self.close(self.wrapper)
+        # Как при выходе из override_settings(DATABASES=...)
+        setting_changed.send(
+            sender=self.__class__, setting="DATABASES", value={}, enter=False
+        )
+        self.assertTrue(idle.closed)
+        self.assertFalse(in_use.closed)
+        # Выданное соединение закрывается при возврате в закрытый пул
+        self.close(other)
+        self.assertTrue(in_use.closed)
+        self.assertEqual(other.connection_pool.snapshot()["in_use"], 0)
+        self.assertIsNot(self.open(self.wrapper), idle)
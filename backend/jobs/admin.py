@@ -0,0 +1,23 @@
+from django.contrib import admin
+
+from foodgram.admin import ScalableModelAdmin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(ScalableModelAdmin):
+    list_display = (
+        "pk",
+        "name",
+        "status",
+        "attempts",
+        "user",
+        "created_at",
+        "touched_at",
+        "finished_at",
+    )
+    search_fields = ("name",)
+    list_filter = ("status", "name")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from jobs import worker
+
+
+# python manage.py runjobs --concurrency 4
+class Command(BaseCommand):
+    help = "Выполняет фоновые задачи из очереди"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.JOBS["CONCURRENCY"],
+            help="Сколько задач выполнять одновременно",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить готовые задачи и завершиться",
+        )
+
+    def handle(self, *args, **kwargs):
+        worker.release_stale()
+        if kwargs["once"]:
+            done = worker.run_pending()
+            self.stdout.write(f"Выполнено задач: {done}")
+            return
+
+        concurrency = max(kwargs["concurrency"], 1)
+        self.stdout.write(f"Воркер запущен, потоков: {concurrency}")
+        futures = set()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while True:
+                    futures = {
+                        future for future in futures if not future.done()
+                    }
+                    free = concurrency - len(futures)
+                    jobs = worker.claim(free) if free else []
+                    for job in jobs:
+                        futures.add(executor.submit(worker.run, job))
+                    if not jobs:
+                        worker.release_stale()
+                        time.sleep(settings.JOBS["POLL_INTERVAL"])
+            except KeyboardInterrupt:
+                self.stdout.write("Остановка: ждем текущие задачи")
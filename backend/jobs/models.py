@@ -0,0 +1,57 @@
+from django.db import models
+from django.utils import timezone
+
+from users.models import User
+
+
+class Job(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Выполнена"),
+        (FAILED, "Ошибка"),
+    )
+
+    name = models.CharField("Задача", max_length=255)
+    payload = models.JSONField("Параметры", default=dict, blank=True)
+    status = models.CharField(
+        "Статус", max_length=16, choices=STATUSES, default=PENDING
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="jobs",
+        verbose_name="Пользователь",
+        blank=True,
+        null=True,
+    )
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        "Максимум попыток", default=3
+    )
+    run_after = models.DateTimeField("Запустить после", default=timezone.now)
+    result = models.JSONField("Результат", blank=True, null=True)
+    error = models.TextField("Ошибка", blank=True)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+    started_at = models.DateTimeField("Запущена", blank=True, null=True)
+    # Отметка воркера о том, что задача еще выполняется (worker.Heartbeat)
+    touched_at = models.DateTimeField("Отметка воркера", blank=True, null=True)
+    finished_at = models.DateTimeField("Завершена", blank=True, null=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = (
+            # Выборка следующей задачи воркером
+            models.Index(
+                fields=("status", "run_after"), name="job_queue_idx"
+            ),
+        )
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
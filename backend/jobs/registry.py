@@ -0,0 +1,48 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Job
+
+Task = namedtuple("Task", ("name", "func", "max_attempts", "concurrency"))
+
+tasks = {}
+
+
+def task(name, max_attempts=3, concurrency=None):
+    """
+    Регистрирует функцию как фоновую задачу.
+    concurrency - сколько таких задач может выполняться одновременно
+    во всех воркерах (None - без ограничения).
+    """
+
+    def decorator(func):
+        tasks[name] = Task(name, func, max_attempts, concurrency)
+        return func
+
+    return decorator
+
+
+def enqueue(name, user=None, **payload):
+    """
+    Ставит задачу в очередь. Задача станет видна воркеру после
+    коммита текущей транзакции.
+    """
+    if name not in tasks:
+        raise KeyError(f"Задача {name} не зарегистрирована")
+    return Job.objects.create(
+        name=name,
+        user=user,
+        payload=payload,
+        max_attempts=tasks[name].max_attempts,
+    )
+
+
+def enqueue_on_commit(name, user=None, **payload):
+    transaction.on_commit(lambda: enqueue(name, user=user, **payload))
+
+
+def enabled():
+    """Запущен ли воркер runjobs (иначе работа выполняется в процессе)."""
+    return settings.JOBS["ENABLED"]
@@ -0,0 +1,98 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import worker
+from .models import Job
+from .registry import task, tasks
+from .worker import claim, release_stale, touch
+
+
+@task("jobs.tests.noop")
+def noop(job):
+    return None
+
+
+@task("jobs.tests.limited", concurrency=2)
+def limited(job):
+    return None
+
+
+@override_settings(JOBS={"STALE_AFTER": 60})
+class ReleaseStaleTests(TestCase):
+    def claim_job(self, **fields):
+        Job.objects.create(name="jobs.tests.noop", **fields)
+        (job,) = claim(1)
+        return job
+
+    def age(self, job, seconds):
+        Job.objects.filter(pk=job.pk).update(
+            touched_at=timezone.now() - timedelta(seconds=seconds)
+        )
+
+    def test_touched_job_not_released(self):
+        job = self.claim_job()
+        self.age(job, 120)
+        touch(job)
+        self.assertEqual(release_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+
+    def test_stale_job_released(self):
+        job = self.claim_job()
+        self.age(job, 120)
+        self.assertEqual(release_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertIsNone(job.touched_at)
+
+    def test_stale_job_failed_after_max_attempts(self):
+        job = self.claim_job(attempts=2, max_attempts=3)
+        self.assertEqual(job.attempts, 3)
+        self.age(job, 120)
+        self.assertEqual(release_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(claim(1), [])
+
+
+class ClaimConcurrencyTests(TestCase):
+    name = "jobs.tests.limited"
+
+    def setUp(self):
+        self.jobs = [Job.objects.create(name=self.name) for _ in range(4)]
+
+    def test_limit_per_task_name(self):
+        Job.objects.create(name="jobs.tests.noop")
+        claimed = claim(10)
+        self.assertEqual(
+            sorted(job.name for job in claimed),
+            [self.name, self.name, "jobs.tests.noop"],
+        )
+        self.assertEqual(claim(10), [])
+
+    def test_limit_checked_when_claiming(self):
+        other = self.jobs[-1]
+
+        calls = []
+
+        class RacingTasks(dict):
+            def get(self, name):
+                # Первую задачу этот воркер уже забрал; теперь другой
+                # воркер забирает последнюю
+                calls.append(name)
+                if len(calls) == 2:
+                    Job.objects.filter(pk=other.pk).update(
+                        status=Job.RUNNING
+                    )
+                return super().get(name)
+
+        with mock.patch.object(worker, "tasks", RacingTasks(tasks)):
+            claimed = claim(10)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(
+            Job.objects.filter(name=self.name, status=Job.RUNNING).count(), 2
+        )
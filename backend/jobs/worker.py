@@ -0,0 +1,181 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Job
+from .registry import tasks
+
+logger = logging.getLogger(__name__)
+
+
+def release_stale():
+    """
+    Возвращает в очередь задачи, по которым воркер не отмечался дольше
+    STALE_AFTER (воркер упал или завис). Задачи, исчерпавшие
+    max_attempts, помечаются ошибкой, а не запускаются снова.
+    """
+    now = timezone.now()
+    deadline = now - timedelta(seconds=settings.JOBS["STALE_AFTER"])
+    stale = Job.objects.filter(status=Job.RUNNING).filter(
+        Q(touched_at__lt=deadline)
+        | Q(touched_at__isnull=True, started_at__lt=deadline)
+    )
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED,
+        error="Воркер перестал отмечать задачу, попытки исчерпаны",
+        finished_at=now,
+    )
+    released = stale.update(
+        status=Job.PENDING, started_at=None, touched_at=None
+    )
+    return released + failed
+
+
+class Heartbeat(threading.Thread):
+    """
+    Пока задача выполняется, раз в HEARTBEAT_INTERVAL обновляет ее
+    touched_at, чтобы release_stale не запустил ее второй раз.
+    """
+
+    def __init__(self, job):
+        super().__init__(name=f"heartbeat-{job.pk}", daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOBS["HEARTBEAT_INTERVAL"]):
+                touch(self.job)
+        except Exception:
+            logger.exception("Не удалось отметить задачу %s", self.job)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def touch(job):
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(
+        touched_at=timezone.now()
+    )
+
+
+def lock_task(name):
+    """
+    Блокировка до конца транзакции на имя задачи (Postgres), чтобы
+    воркеры захватывали задачи с ограничением concurrency по очереди.
+    На SQLite пишет один процесс за раз, и условный UPDATE в claim
+    сам видит все закоммиченные захваты.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtext(%s))",
+                [f"jobs:{name}"],
+            )
+
+
+def claim(limit):
+    """
+    Забирает до limit готовых к запуску задач.
+    Захват - условный UPDATE по статусу, поэтому несколько воркеров
+    не получат одну задачу ни на Postgres, ни на SQLite.
+    Для задач с concurrency тот же UPDATE проверяет число выполняемых
+    задач с этим именем, а lock_task не дает двум воркерам проверить
+    его одновременно.
+    """
+    claimed = []
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.PENDING, run_after__lte=now
+    ).order_by("run_after", "id")[:limit * 4]
+    for job in candidates:
+        if len(claimed) >= limit:
+            break
+        task = tasks.get(job.name)
+        if task is None:
+            continue
+        pending = Job.objects.filter(pk=job.pk, status=Job.PENDING)
+        changes = {
+            "status": Job.RUNNING,
+            "started_at": now,
+            "touched_at": now,
+            "attempts": F("attempts") + 1,
+        }
+        if task.concurrency is None:
+            updated = pending.update(**changes)
+        else:
+            running = (
+                Job.objects.filter(name=job.name, status=Job.RUNNING)
+                .order_by()
+                .values("name")
+                .annotate(count=Count("id"))
+                .values("count")
+            )
+            with transaction.atomic():
+                lock_task(job.name)
+                updated = (
+                    pending.annotate(
+                        running=Coalesce(Subquery(running), 0)
+                    )
+                    .filter(running__lt=task.concurrency)
+                    .update(**changes)
+                )
+        if updated:
+            job.refresh_from_db()
+            claimed.append(job)
+    return claimed
+
+
+def run(job):
+    """Выполняет задачу; при ошибке планирует повтор с задержкой."""
+    close_old_connections()
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        result = tasks[job.name].func(job, **job.payload)
+    except Exception:
+        logger.exception("Задача %s упала", job)
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = settings.JOBS["RETRY_DELAY"] * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING,
+                error=error,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, error=error, finished_at=timezone.now()
+            )
+    else:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.DONE,
+            result=result,
+            error="",
+            finished_at=timezone.now(),
+        )
+    finally:
+        heartbeat.stop()
+        close_old_connections()
+
+
+def run_pending(limit=None):
+    """Синхронно выполняет все готовые задачи (для --once и тестов)."""
+    done = 0
+    while limit is None or done < limit:
+        jobs = claim(1)
+        if not jobs:
+            break
+        run(jobs[0])
+        done += 1
+    return done
@@ -1,5 +1,7 @@
 from django.contrib import admin
 
+from foodgram.admin import ScalableModelAdmin
+
 from .models import (
     Favorite,
     Ingredient,
@@ -11,69 +13,71 @@ from .models import (
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ScalableModelAdmin):
     list_display = ("pk", "name", "measurement_unit")
-    search_fields = ("name", "measurement_unit")
-    list_filter = ("name", "measurement_unit")
+    # LIKE 'x%' по ingredient_name_prefix_idx (см. ScalableModelAdmin)
+    search_fields = ("name__startswith",)
+    lowercase_search_term = True
+    list_filter = ("measurement_unit",)
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ("pk", "name", "color", "slug")
-    search_fields = ("name", "color", "slug")
-    list_filter = ("name", "color", "slug")
+    search_fields = ("name", "slug")
+
+
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    autocomplete_fields = ("ingredient",)
+    extra = 0
+    min_num = 1
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ScalableModelAdmin):
     list_display = (
         "pk",
-        "author",
         "name",
-        "image",
-        "text",
-        "cooking_time",
-        "pub_date",
-    )
-    search_fields = (
-        "tags",
         "author",
-        "ingredients",
-        "name",
-        "image",
-        "text",
-        "cooking_time",
-        "pub_date",
-    )
-    list_filter = (
-        "tags",
-        "author",
-        "ingredients",
-        "name",
-        "image",
-        "text",
         "cooking_time",
         "pub_date",
+        "favorites_count",
+        "shopping_cart_count",
     )
+    list_select_related = ("author",)
+    readonly_fields = ("favorites_count", "shopping_cart_count")
+    autocomplete_fields = ("author", "tags")
+    inlines = (RecipeIngredientInline,)
+    # ^author__username - UPPER(username) LIKE 'X%' по индексу
+    # user_username_upper_idx (миграция users 0005, только Postgres)
+    search_fields = ("name", "^author__username", "=author__email")
+    # Фильтры с ограниченным набором вариантов, без DISTINCT по таблице
+    list_filter = ("tags", "pub_date")
     empty_value_display = "-пусто-"
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(ScalableModelAdmin):
     list_display = ("pk", "recipe", "ingredient", "amount")
-    search_fields = ("recipe", "ingredient", "amount")
-    list_filter = ("recipe", "ingredient", "amount")
+    list_select_related = ("recipe", "ingredient")
+    raw_id_fields = ("recipe",)
+    autocomplete_fields = ("ingredient",)
+    search_fields = ("recipe__name", "ingredient__name__startswith")
+    lowercase_search_term = True
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(ScalableModelAdmin):
     list_display = ("pk", "user", "recipe")
-    search_fields = ("user", "recipe")
-    list_filter = ("user", "recipe")
+    list_select_related = ("user", "recipe")
+    autocomplete_fields = ("user", "recipe")
+    search_fields = ("user__username", "recipe__name")
 
 
 @admin.register(ShoppingList)
-class ShoppingListAdmin(admin.ModelAdmin):
+class ShoppingListAdmin(ScalableModelAdmin):
     list_display = ("pk", "user", "recipe")
-    search_fields = ("user", "recipe")
-    list_filter = ("user", "recipe")
+    list_select_related = ("user", "recipe")
+    autocomplete_fields = ("user", "recipe")
+    search_fields = ("user__username", "recipe__name")
@@ -0,0 +1,58 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Follow, User
+
+from .models import Favorite, Recipe, ShoppingList
+
+# (модель со счетчиком, поле счетчика, считаемая модель, FK на владельца)
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "shopping_cart_count", ShoppingList, "recipe"),
+    (User, "followers_count", Follow, "author"),
+    (User, "recipes_count", Recipe, "author"),
+)
+
+
+def bump(model, pk, field, delta):
+    """Атомарно меняет счетчик на delta (UPDATE ... SET x = x + delta)."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def actual_count(related, field):
+    return Coalesce(
+        Subquery(
+            related.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def recount(model, counter, related, field, pks):
+    """Пересчитывает счетчик владельцев pks одним UPDATE."""
+    return model.objects.filter(pk__in=pks).update(
+        **{counter: actual_count(related, field)}
+    )
+
+
+def reconcile():
+    """
+    Пересчитывает счетчики, разошедшиеся с данными (после bulk_create,
+    ручных правок в БД и т.п.). Возвращает число исправленных строк
+    по каждому счетчику.
+    """
+    fixed = {}
+    for model, counter, related, field in COUNTERS:
+        actual = actual_count(related, field)
+        fixed[f"{model._meta.label}.{counter}"] = (
+            model.objects.exclude(**{counter: actual}).update(
+                **{counter: actual}
+            )
+        )
+    return fixed
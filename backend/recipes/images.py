@@ -0,0 +1,197 @@
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from jobs import registry as jobs
+
+from .storage import recipe_image_storage as storage
+
+logger = logging.getLogger(__name__)
+
+# Формат -> (формат Pillow, параметры сохранения)
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix="recipe-images",
+)
+
+
+def variants_dir(image_name):
+    """recipe_images/<sha256>.png -> recipe_images/variants/<sha256>."""
+    folder, filename = posixpath.split(image_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(folder, "variants", stem)
+
+
+def render_variant(source, size, image_format, options):
+    image = source.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    if image_format == "JPEG" and image.mode != "RGB":
+        # В JPEG нет прозрачности: подкладываем белый фон
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def build_variants(recipe_id):
+    """
+    Строит уменьшенные копии картинки рецепта (RECIPE_IMAGE_VARIANTS)
+    в WebP и JPEG и сохраняет пути в Recipe.image_variants.
+    Копии тоже называются по содержимому и лежат в папке картинки.
+    """
+    from .models import Recipe
+
+    recipe = Recipe.objects.filter(pk=recipe_id).only("image").first()
+    if recipe is None or not recipe.image:
+        return
+    source_name = recipe.image.name
+    with recipe.image.open("rb") as file:
+        source = Image.open(file)
+        source.load()
+    folder = variants_dir(source_name)
+    variants = {}
+    for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        variants[variant] = {}
+        for extension, (image_format, options) in FORMATS.items():
+            name = posixpath.join(folder, f"{variant}.{extension}")
+            variants[variant][extension] = storage.save(
+                name,
+                ContentFile(
+                    render_variant(source, size, image_format, options)
+                ),
+            )
+    # Картинку могли заменить, пока строились копии
+    Recipe.objects.filter(pk=recipe_id, image=source_name).update(
+        image_variants={"source": source_name, "variants": variants},
+        updated_at=timezone.now(),
+    )
+
+
+def run_build_variants(recipe_id):
+    close_old_connections()
+    try:
+        build_variants(recipe_id)
+    except Exception:
+        logger.exception("Не удалось построить копии картинки %s", recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(recipe):
+    """
+    Запускает построение копий после коммита: задачей в очереди, если
+    работает воркер runjobs, иначе в пуле потоков процесса.
+    """
+    if jobs.enabled():
+        jobs.enqueue_on_commit(
+            "recipes.build_image_variants", recipe_id=recipe.pk
+        )
+        return
+    transaction.on_commit(
+        lambda: executor.submit(run_build_variants, recipe.pk)
+    )
+
+
+def variants_are_stale(recipe):
+    if not recipe.image:
+        return False
+    return (recipe.image_variants or {}).get("source") != recipe.image.name
+
+
+def recently_used(name):
+    """Файл сохранен или загружен повторно за RECIPE_IMAGE_GC_GRACE."""
+    grace = timedelta(seconds=settings.RECIPE_IMAGE_GC_GRACE)
+    try:
+        return storage.get_modified_time(name) > timezone.now() - grace
+    except FileNotFoundError:
+        return False
+
+
+def release_image(name):
+    """
+    Удаляет картинку и папку ее копий, если на картинку больше не
+    ссылается ни один рецепт. Недавно использованный файл остается
+    для collect_garbage. Возвращает True, если файл удален.
+    """
+    from .models import Recipe
+
+    if (
+        not name
+        or Recipe.objects.filter(image=name).exists()
+        or recently_used(name)
+    ):
+        return False
+    folder = variants_dir(name)
+    if storage.exists(folder):
+        for filename in storage.listdir(folder)[1]:
+            storage.delete(posixpath.join(folder, filename))
+    storage.delete(name)
+    return True
+
+
+def run_release_image(name):
+    try:
+        release_image(name)
+    except Exception:
+        logger.exception("Не удалось удалить картинку %s", name)
+
+
+def schedule_release(name):
+    """Проверяет картинку после коммита удаления или замены."""
+    transaction.on_commit(lambda: run_release_image(name))
+
+
+def walk(folder):
+    directories, files = storage.listdir(folder)
+    for filename in files:
+        yield posixpath.join(folder, filename)
+    for directory in directories:
+        yield from walk(posixpath.join(folder, directory))
+
+
+def collect_garbage(dry_run=False):
+    """
+    Удаляет из папки картинок рецептов файлы, на которые не ссылается
+    ни один рецепт (ни как на картинку, ни как на копию) и которые не
+    использовались RECIPE_IMAGE_GC_GRACE секунд: копии прошлых
+    настроек RECIPE_IMAGE_VARIANTS, файлы отмененных транзакций,
+    недописанные .upload-*. Возвращает число удаленных файлов.
+    """
+    from .models import Recipe
+
+    referenced = set()
+    for image, image_variants in Recipe.objects.values_list(
+        "image", "image_variants"
+    ).iterator():
+        referenced.add(image)
+        for formats in (image_variants or {}).get("variants", {}).values():
+            referenced.update(formats.values())
+    folder = Recipe._meta.get_field("image").upload_to.rstrip("/")
+    if not storage.exists(folder):
+        return 0
+    removed = 0
+    for name in walk(folder):
+        if name in referenced or recently_used(name):
+            continue
+        if not dry_run:
+            storage.delete(name)
+        removed += 1
+    if not dry_run:
+        logger.info("Удалено неиспользуемых картинок: %d", removed)
+    return removed
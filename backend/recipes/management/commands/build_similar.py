@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand
+
+from jobs import registry as jobs
+from recipes.similarity import build_similar
+
+
+# python manage.py build_similar [--full] [--background]
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает похожие рецепты для измененных рецептов "
+        "(с --full - для всех)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true", help="Пересчитать все рецепты"
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Поставить задачу в очередь runjobs",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            job = jobs.enqueue("recipes.build_similar", full=options["full"])
+            self.stdout.write(f"Задача {job.pk} поставлена в очередь")
+            return
+        count = build_similar(full=options["full"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересчитано рецептов: {count}")
+        )
@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand
+
+from jobs import registry as jobs
+from recipes.images import collect_garbage
+
+
+# python manage.py collect_media [--dry-run] [--background]
+class Command(BaseCommand):
+    help = (
+        "Удаляет картинки рецептов и их копии, на которые не ссылается "
+        "ни один рецепт"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать файлы, ничего не удаляя",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Поставить задачу в очередь runjobs",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            job = jobs.enqueue(
+                "recipes.collect_media", dry_run=options["dry_run"]
+            )
+            self.stdout.write(f"Задача {job.pk} поставлена в очередь")
+            return
+        removed = collect_garbage(dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"Будет удалено файлов: {removed}")
+        else:
+            self.stdout.write(f"Удалено файлов: {removed}")
@@ -0,0 +1,280 @@
+import random
+import string
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.counters import reconcile
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+)
+from users.models import Follow, User
+
+DEFAULT_TAGS = (
+    ("завтрак", "#E26C2D", "breakfast"),
+    ("обед", "#49B64E", "lunch"),
+    ("ужин", "#8775D2", "dinner"),
+)
+WORDS = (
+    "нарезать", "смешать", "добавить", "обжарить", "варить", "запекать",
+    "посолить", "поперчить", "подавать", "остудить", "взбить", "тушить",
+    "минут", "огонь", "сковорода", "духовка", "кастрюля", "соус",
+)
+# Публикации распределяются на --days дней до этой даты: с тем же --seed
+# данные совпадают при любом запуске
+DEFAULT_END = date(2024, 1, 1)
+# Наименьшие допустимые значения параметров
+MINIMUMS = {
+    "users": 1,
+    "recipes": 1,
+    "follows": 0,
+    "favorites": 0,
+    "cart": 0,
+    "days": 0,
+    "batch_size": 1,
+}
+
+
+def zipf_weights(count, exponent=1.1):
+    """Популярность по закону Ципфа: немногие объекты получают почти все."""
+    return list(
+        accumulate(1 / rank ** exponent for rank in range(1, count + 1))
+    )
+
+
+# python manage.py generate_data --users 1000 --recipes 20000 --seed 42
+class Command(BaseCommand):
+    help = (
+        "Генерирует пользователей, рецепты, подписки, избранное и корзины "
+        "для нагрузочного тестирования"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--recipes", type=int, default=1000)
+        parser.add_argument("--follows", type=int, default=10,
+                            help="Подписок на пользователя (в среднем)")
+        parser.add_argument("--favorites", type=int, default=20,
+                            help="Избранных рецептов на пользователя")
+        parser.add_argument("--cart", type=int, default=5,
+                            help="Рецептов в корзине на пользователя")
+        parser.add_argument("--days", type=int, default=365,
+                            help="За сколько дней распределить публикации")
+        parser.add_argument("--end", type=date.fromisoformat,
+                            default=DEFAULT_END,
+                            help="Дата последней публикации, YYYY-MM-DD")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for option, minimum in MINIMUMS.items():
+            if options[option] < minimum:
+                raise CommandError(
+                    f"--{option.replace('_', '-')} должно быть не меньше "
+                    f"{minimum}"
+                )
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        ingredient_ids = list(Ingredient.objects.values_list("id", flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                "Нет ингредиентов: сначала выполните "
+                "python manage.py load --path ../data/ingredients.csv"
+            )
+        prefix = f"bench{options['seed']}"
+        if User.objects.filter(username__startswith=f"{prefix}_").exists():
+            raise CommandError(
+                f"Данные с --seed {options['seed']} уже созданы: "
+                "укажите другой --seed"
+            )
+        end = datetime.combine(
+            options["end"], datetime.min.time(), tzinfo=timezone.utc
+        )
+        started = time.monotonic()
+        with transaction.atomic():
+            tag_ids = self.ensure_tags()
+            users = self.create_users(options["users"], prefix)
+            recipes = self.create_recipes(
+                users, options["recipes"], options["days"], end
+            )
+            self.create_recipe_relations(recipes, tag_ids, ingredient_ids)
+            self.create_user_relations(users, recipes, options)
+            # bulk_create не вызывает сигналы счетчиков
+            reconcile()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано: пользователей {len(users)}, рецептов "
+                f"{len(recipes)} за {time.monotonic() - started:.1f} с"
+            )
+        )
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        return list(Tag.objects.values_list("id", flat=True))
+
+    def create_users(self, count, prefix):
+        # Хэш одного пароля на всех: PBKDF2 на каждого занял бы минуты.
+        # Соль - из того же генератора, чтобы хэш тоже повторялся
+        salt = "".join(
+            self.rng.choices(string.ascii_letters + string.digits, k=22)
+        )
+        password = make_password("benchmark-password", salt)
+        users = User.objects.bulk_create(
+            (
+                User(
+                    username=f"{prefix}_{number}",
+                    email=f"{prefix}_{number}@example.com",
+                    first_name=f"Имя{number}",
+                    last_name=f"Фамилия{number}",
+                    password=password,
+                )
+                for number in range(count)
+            ),
+            batch_size=self.batch_size,
+        )
+        if users and users[0].pk is None:
+            # SQLite до Django 4 не возвращает id из bulk_create
+            users = list(
+                User.objects.filter(username__startswith=f"{prefix}_")
+                .order_by("id")
+            )
+        self.log(f"Пользователи: {len(users)}")
+        return users
+
+    def create_recipes(self, users, count, days, end):
+        authors = self.rng.choices(
+            users, cum_weights=zipf_weights(len(users)), k=count
+        )
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author,
+                    name=f"Рецепт {number}",
+                    text=" ".join(self.rng.choices(WORDS, k=40)),
+                    cooking_time=self.rng.randint(5, 180),
+                )
+                for number, author in enumerate(authors)
+            ),
+            batch_size=self.batch_size,
+        )
+        if recipes and recipes[0].pk is None:
+            recipes = list(
+                Recipe.objects.filter(author__in=users).order_by("id")
+            )
+        # auto_now_add и auto_now ставят всем текущее время: разносим
+        # публикации по --days дням до --end
+        for recipe in recipes:
+            recipe.pub_date = recipe.updated_at = end - timedelta(
+                seconds=self.rng.randint(0, days * 24 * 60 * 60)
+            )
+        Recipe.objects.bulk_update(
+            recipes, ("pub_date", "updated_at"), batch_size=self.batch_size
+        )
+        # bulk_create не вызывает сигналы
+        Recipe.objects.filter(author__in=users).update_search_vector()
+        self.log(f"Рецепты: {len(recipes)}")
+        return recipes
+
+    def create_recipe_relations(self, recipes, tag_ids, ingredient_ids):
+        ingredient_weights = zipf_weights(len(ingredient_ids), 0.8)
+        tag_links = []
+        ingredient_rows = []
+        for recipe in recipes:
+            for tag_id in self.rng.sample(
+                tag_ids, self.rng.randint(1, min(3, len(tag_ids)))
+            ):
+                tag_links.append(
+                    Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                )
+            size = min(
+                round(self.rng.triangular(2, 20, 7)), len(ingredient_ids)
+            )
+            chosen = set()
+            while len(chosen) < size:
+                chosen.update(
+                    self.rng.choices(
+                        ingredient_ids,
+                        cum_weights=ingredient_weights,
+                        k=size - len(chosen),
+                    )
+                )
+            for ingredient_id in chosen:
+                ingredient_rows.append(
+                    RecipeIngredient(
+                        recipe_id=recipe.pk,
+                        ingredient_id=ingredient_id,
+                        amount=self.rng.choice((1, 2, 3, 5, 50, 100, 200)),
+                    )
+                )
+        Recipe.tags.through.objects.bulk_create(
+            tag_links, batch_size=self.batch_size
+        )
+        RecipeIngredient.objects.bulk_create(
+            ingredient_rows, batch_size=self.batch_size
+        )
+        self.log(
+            f"Теги рецептов: {len(tag_links)}, "
+            f"ингредиенты рецептов: {len(ingredient_rows)}"
+        )
+
+    def create_user_relations(self, users, recipes, options):
+        user_weights = zipf_weights(len(users))
+        recipe_weights = zipf_weights(len(recipes), 0.9)
+        # Популярные рецепты - случайные, а не самые старые
+        popular = self.rng.sample(recipes, len(recipes))
+        follows, favorites, carts = [], [], []
+        for user in users:
+            for author in set(
+                self.rng.choices(
+                    users,
+                    cum_weights=user_weights,
+                    k=self.rng.randint(0, options["follows"] * 2),
+                )
+            ):
+                if author.pk != user.pk:
+                    follows.append(Follow(user=user, author=author))
+            for recipe in set(
+                self.rng.choices(
+                    popular,
+                    cum_weights=recipe_weights,
+                    k=self.rng.randint(0, options["favorites"] * 2),
+                )
+            ):
+                favorites.append(Favorite(user=user, recipe=recipe))
+            for recipe in set(
+                self.rng.choices(
+                    popular,
+                    cum_weights=recipe_weights,
+                    k=self.rng.randint(0, options["cart"] * 2),
+                )
+            ):
+                carts.append(ShoppingList(user=user, recipe=recipe))
+        for model, rows in (
+            (Follow, follows),
+            (Favorite, favorites),
+            (ShoppingList, carts),
+        ):
+            model.objects.bulk_create(
+                rows, batch_size=self.batch_size, ignore_conflicts=True
+            )
+        self.log(
+            f"Подписки: {len(follows)}, избранное: {len(favorites)}, "
+            f"корзины: {len(carts)}"
+        )
@@ -1,24 +1,157 @@
 import csv
+import io
+import json
+import time
+from pathlib import Path
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.autocomplete import ingredient_index
+from api.cache import ingredients_cache
 from recipes.models import Ingredient
 
 
+class DryRunRollback(Exception):
+    """Откатывает транзакцию при --dry-run."""
+
+
 # python manage.py load --path ../data/ingredients.csv
+# python manage.py load --path ../data/ingredients.json --batch-size 5000
 class Command(BaseCommand):
-    help = "Загружает ингредиенты"
+    help = "Загружает ингредиенты из CSV или JSON"
 
     def add_arguments(self, parser):
-        parser.add_argument("--path", type=str)
+        parser.add_argument("--path", type=str, required=True)
+        parser.add_argument(
+            "--format",
+            choices=("csv", "json"),
+            help="Формат файла (по умолчанию - по расширению)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Проверить файл и откатить изменения",
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Не использовать COPY даже на Postgres",
+        )
 
     def handle(self, *args, **kwargs):
-        path = kwargs["path"]
+        path = Path(kwargs["path"])
+        batch_size = kwargs["batch_size"]
+        if batch_size <= 0:
+            raise CommandError("--batch-size должен быть больше 0")
+        file_format = kwargs["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in ("csv", "json"):
+            raise CommandError(f"Неизвестный формат файла: {path}")
+
+        started = time.monotonic()
+        rows = self.read_rows(path, file_format)
+        use_copy = connection.vendor == "postgresql" and not kwargs["no_copy"]
+        before = Ingredient.objects.count()
+        try:
+            with transaction.atomic():
+                for done in range(0, len(rows), batch_size):
+                    batch = rows[done:done + batch_size]
+                    if use_copy:
+                        self.copy_batch(batch)
+                    else:
+                        Ingredient.objects.bulk_create(
+                            [
+                                Ingredient(
+                                    name=name, measurement_unit=unit
+                                )
+                                for name, unit in batch
+                            ],
+                            ignore_conflicts=True,
+                        )
+                    self.stdout.write(
+                        f"Обработано {done + len(batch)} из {len(rows)}"
+                    )
+                inserted = Ingredient.objects.count() - before
+                if kwargs["dry_run"]:
+                    raise DryRunRollback
+        except DryRunRollback:
+            pass
+        else:
+            # bulk_create и COPY не отправляют post_save
+            ingredient_index.invalidate()
+            ingredients_cache.invalidate()
+
+        elapsed = time.monotonic() - started
+        mode = " (dry-run)" if kwargs["dry_run"] else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Загрузка завершена{mode}: "
+                f"строк {len(rows)}, добавлено {inserted}, "
+                f"уже было {len(rows) - inserted}, "
+                f"{elapsed:.2f} с ({len(rows) / max(elapsed, 1e-6):.0f} стр/с)"
+            )
+        )
+
+    def read_rows(self, path, file_format):
+        """
+        Читает пары (name, measurement_unit) без дублей.
+        name приводится к lowercase, как это делает NameField.
+        """
         with open(path, "rt", encoding="utf-8") as f:
-            reader = csv.reader(f, delimiter=",")
-            for row in reader:
-                Ingredient.objects.create(
-                    name=row[0],
-                    measurement_unit=row[1],
-                )
-        print("Загрузка завершена")
+            if file_format == "json":
+                try:
+                    items = json.load(f)
+                except ValueError as error:
+                    raise CommandError(f"Некорректный JSON: {error}")
+                if not isinstance(items, list):
+                    raise CommandError("JSON должен быть списком объектов")
+                items = (self.json_row(item) for item in items)
+            else:
+                items = csv.reader(f, delimiter=",")
+            rows = {}
+            for number, item in enumerate(items, start=1):
+                if (
+                    item is None
+                    or len(item) < 2
+                    or not isinstance(item[0], str)
+                    or not isinstance(item[1], str)
+                    or not item[0].strip()
+                ):
+                    raise CommandError(f"Некорректная строка {number}")
+                name, unit = item[0].strip().lower(), item[1].strip()
+                rows[(name, unit)] = None
+        return list(rows)
+
+    @staticmethod
+    def json_row(item):
+        """Пара из объекта JSON или None, если полей нет."""
+        if not isinstance(item, dict):
+            return None
+        if "name" not in item or "measurement_unit" not in item:
+            return None
+        return item["name"], item["measurement_unit"]
+
+    def copy_batch(self, batch):
+        """COPY во временную таблицу и перенос без конфликтов."""
+        table = Ingredient._meta.db_table
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS ingredient_load "
+                "(name varchar(255), measurement_unit varchar(255)) "
+                "ON COMMIT DROP"
+            )
+            cursor.execute("TRUNCATE ingredient_load")
+            cursor.copy_expert(
+                "COPY ingredient_load (name, measurement_unit) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT name, measurement_unit FROM ingredient_load "
+                "ON CONFLICT (name, measurement_unit) DO NOTHING"
+            )
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from jobs import registry as jobs
+from recipes.counters import reconcile
+
+
+# python manage.py reconcile_counters [--background]
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики избранного, корзин, подписчиков и рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Поставить задачу в очередь runjobs",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            job = jobs.enqueue("recipes.reconcile_counters")
+            self.stdout.write(f"Задача {job.pk} поставлена в очередь")
+            return
+        for counter, fixed in reconcile().items():
+            self.stdout.write(f"{counter}: исправлено {fixed}")
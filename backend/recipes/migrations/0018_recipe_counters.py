@@ -0,0 +1,53 @@
+# Generated by Django 3.2 on 2026-10-18 06:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (модель со счетчиком, поле счетчика, считаемая модель, FK на владельца)
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'shopping_cart_count', 'recipes.ShoppingList',
+     'recipe'),
+    ('users.User', 'followers_count', 'users.Follow', 'author'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_label, counter, related_label, field in COUNTERS:
+        model = apps.get_model(model_label)
+        related = apps.get_model(related_label)
+        actual = Coalesce(
+            Subquery(
+                related.objects.filter(**{field: OuterRef('pk')})
+                .order_by()
+                .values(field)
+                .annotate(count=Count('pk'))
+                .values('count')
+            ),
+            0,
+        )
+        model.objects.update(**{counter: actual})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_search_vector'),
+        ('users', '0004_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,29 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+)
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import (
+    BooleanField,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Value,
+)
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
 
-from users.models import User
+from users.models import Follow, User
+
+from .storage import recipe_image_storage
+
+# Конфигурация полнотекстового поиска Postgres (стемминг русского)
+SEARCH_CONFIG = "russian"
 
 
 class NameField(models.CharField):
@@ -36,6 +58,14 @@ class Ingredient(models.Model):
                 fields=("name", "measurement_unit"), name="unique_ingredient"
             ),
         )
+        indexes = (
+            # LIKE 'x%' для поиска по началу имени
+            models.Index(
+                fields=("name",),
+                name="ingredient_name_prefix_idx",
+                opclasses=("varchar_pattern_ops",),
+            ),
+        )
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
         ordering = ("name",)
@@ -58,6 +88,121 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """
+    Планирование запросов для выдачи рецептов.
+    Страница любого размера отдается за постоянное число запросов.
+    """
+
+    def with_user_flags(self, user):
+        """Аннотирует is_favorited и is_in_shopping_cart через Exists."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingList.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
+
+    def with_related(self, user):
+        """
+        Подгружает теги, ингредиенты и автора (с is_subscribed)
+        отдельными запросами на всю выборку.
+        """
+        if user.is_authenticated:
+            is_subscribed = Exists(
+                Follow.objects.filter(user=user, author=OuterRef("pk"))
+            )
+        else:
+            is_subscribed = Value(False, output_field=BooleanField())
+        return self.prefetch_related(
+            "tags",
+            Prefetch(
+                "author",
+                queryset=User.objects.annotate(is_subscribed=is_subscribed),
+            ),
+            Prefetch(
+                "ingredients_in_recipes",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ).order_by("pk"),
+            ),
+        )
+
+    def for_feed(self, user):
+        # search_vector нужен только в условии поиска
+        return (
+            self.defer("search_vector")
+            .with_user_flags(user)
+            .with_related(user)
+        )
+
+    def first_per_author(self, author_ids, limit=None):
+        """
+        Первые limit рецептов каждого из авторов одним запросом
+        с ROW_NUMBER() OVER (PARTITION BY author_id).
+        """
+        author_ids = list(author_ids)
+        if not author_ids:
+            return self.none()
+        if limit is None:
+            return self.filter(author_id__in=author_ids)
+        placeholders = ", ".join(["%s"] * len(author_ids))
+        ranked = (
+            "SELECT id FROM ("
+            "SELECT id, ROW_NUMBER() OVER ("
+            "PARTITION BY author_id ORDER BY pub_date DESC, id DESC"
+            f") AS row_number FROM {self.model._meta.db_table} "
+            f"WHERE author_id IN ({placeholders})"
+            ") AS ranked WHERE row_number <= %s"
+        )
+        return self.filter(pk__in=RawSQL(ranked, (*author_ids, limit)))
+
+    @property
+    def is_postgresql(self):
+        return connections[self.db].vendor == "postgresql"
+
+    def update_search_vector(self):
+        """
+        Пересчитывает search_vector: название с весом A, описание - B.
+        Вне Postgres ничего не делает.
+        """
+        if not self.is_postgresql:
+            return 0
+        return self.update(
+            search_vector=SearchVector(
+                "name", weight="A", config=SEARCH_CONFIG
+            )
+            + SearchVector("text", weight="B", config=SEARCH_CONFIG)
+        )
+
+    def search(self, term):
+        """
+        Полнотекстовый поиск по GIN-индексу search_vector с сортировкой
+        по релевантности (синтаксис запроса как у поисковиков: "фраза",
+        -исключение, or). Вне Postgres - поиск подстроки без ранжирования
+        (SQLite не различает регистр только у ASCII).
+        """
+        if not self.is_postgresql:
+            return self.filter(
+                Q(name__icontains=term) | Q(text__icontains=term)
+            )
+        query = SearchQuery(
+            term, config=SEARCH_CONFIG, search_type="websearch"
+        )
+        return (
+            self.filter(search_vector=query)
+            .annotate(search_rank=SearchRank(F("search_vector"), query))
+            .order_by("-search_rank", "-pub_date", "-id")
+        )
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag,
@@ -78,11 +223,23 @@ class Recipe(models.Model):
         "Название рецепта",
         max_length=255,
     )
+    # Имя файла - sha256 содержимого (recipes/storage.py); индекс
+    # нужен для проверки ссылок перед удалением файла
     image = models.ImageField(
         "Картинка",
         upload_to="recipe_images/",
+        storage=recipe_image_storage,
         blank=True,
         null=True,
+        db_index=True,
+    )
+    # {"source": имя картинки, "variants": {вариант: {формат: имя}}},
+    # заполняется в фоне (recipes/images.py)
+    image_variants = models.JSONField(
+        "Копии картинки",
+        default=dict,
+        blank=True,
+        editable=False,
     )
     text = models.TextField(
         "Описание",
@@ -94,9 +251,43 @@ class Recipe(models.Model):
         "Дата публикации",
         auto_now_add=True,
     )
+    # Обновляется и при изменении тегов, ингредиентов и автора
+    # (recipes/signals.py); используется для ETag/Last-Modified
+    updated_at = models.DateTimeField(
+        "Дата изменения",
+        auto_now=True,
+    )
+    # Поддерживается сигналом post_save (recipes/signals.py),
+    # GIN-индекс создается миграцией только на Postgres
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Счетчики поддерживаются сигналами (recipes/counters.py)
+    favorites_count = models.PositiveIntegerField(
+        "В избранном", default=0, editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        "В списках покупок", default=0, editable=False
+    )
+    # Когда в последний раз считались похожие рецепты
+    # (recipes/similarity.py); None - еще не считались
+    similar_computed_at = models.DateTimeField(
+        "Похожие рецепты рассчитаны", null=True, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-id")
+        indexes = (
+            # Лента и keyset-пагинация по (pub_date, id)
+            models.Index(
+                fields=("-pub_date", "-id"), name="recipe_feed_idx"
+            ),
+            # Лента автора: author=... ORDER BY pub_date DESC
+            models.Index(
+                fields=("author", "-pub_date", "-id"),
+                name="recipe_author_feed_idx",
+            ),
+        )
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
 
@@ -190,3 +381,82 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f"{self.recipe.name} в списке покупок {self.user.username}"
+
+
+class SimilarRecipe(models.Model):
+    """Похожие рецепты, рассчитанные recipes/similarity.py."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_recipes",
+        verbose_name="Рецепт",
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+        verbose_name="Похожий рецепт",
+    )
+    score = models.FloatField("Сходство")
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("recipe", "similar"), name="unique_similar_recipe"
+            ),
+        )
+        verbose_name = "Похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+
+    def __str__(self):
+        return f"{self.similar_id} похож на {self.recipe_id}: {self.score}"
+
+
+class DataVersion(models.Model):
+    """
+    Версия набора данных, который процессы кэшируют у себя: справочники,
+    индекс "что приготовить". Хранится в БД, поэтому изменение из любого
+    процесса (в том числе из команд manage.py) видят все воркеры,
+    даже если кэш Django у каждого свой. Здесь же хранится отметка
+    расчета похожих рецептов (recipes/similarity.py).
+    """
+
+    name = models.CharField("Набор данных", max_length=64, primary_key=True)
+    value = models.PositiveBigIntegerField("Версия", default=0)
+    updated_at = models.DateTimeField("Изменено", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Версия данных"
+        verbose_name_plural = "Версии данных"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @property
+    def token(self):
+        # Время изменения отличает версию и от пересозданной строки
+        # (восстановление БД), у которой счетчик начнется заново
+        return f"{self.value}.{self.updated_at.timestamp()}"
+
+    @classmethod
+    def current(cls, name):
+        try:
+            return cls.objects.get(name=name)
+        except cls.DoesNotExist:
+            pass
+        try:
+            with transaction.atomic():
+                return cls.objects.create(name=name)
+        except IntegrityError:
+            # Строку успел создать другой процесс
+            return cls.objects.get(name=name)
+
+    @classmethod
+    def bump(cls, name):
+        """Увеличивает версию на 1 одним UPDATE."""
+        rows = cls.objects.filter(name=name)
+        changes = {"value": F("value") + 1, "updated_at": timezone.now()}
+        if not rows.update(**changes):
+            cls.current(name)
+            rows.update(**changes)
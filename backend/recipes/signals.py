@@ -0,0 +1,129 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import User
+
+from .counters import COUNTERS, bump, recount
+from .images import schedule_release, schedule_variants, variants_are_stale
+from .models import Ingredient, Recipe, RecipeIngredient, Tag
+from .transactions import CommitBatch
+
+
+def touch_recipes(**filters):
+    """Сдвигает updated_at рецептов, чье представление изменилось."""
+    Recipe.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+# Один UPDATE на транзакцию, а не на каждую строку: удаление
+# N ингредиентов рецепта шлет N сигналов post_delete
+touch_batch = CommitBatch(lambda recipe_ids: touch_recipes(pk__in=recipe_ids))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_on_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif pk_set:
+        recipe_ids = pk_set
+    else:
+        # pre_clear со стороны тега: связи еще на месте
+        recipe_ids = Recipe.objects.filter(tags=instance).values_list(
+            "pk", flat=True
+        )
+    touch_batch.add(*recipe_ids)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def touch_on_ingredient_in_recipe(instance, **kwargs):
+    touch_batch.add(instance.recipe_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_on_tag(instance, **kwargs):
+    touch_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_on_ingredient(instance, **kwargs):
+    touch_recipes(ingredients=instance)
+
+
+@receiver(post_save, sender=User)
+def touch_on_author(instance, created, update_fields, **kwargs):
+    # Вход в систему сохраняет только last_login
+    if created or update_fields == frozenset(("last_login",)):
+        return
+    touch_recipes(author=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(instance, created, update_fields, **kwargs):
+    if created or not update_fields or {"name", "text"} & update_fields:
+        Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_variants(instance, **kwargs):
+    if variants_are_stale(instance):
+        schedule_variants(instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def release_replaced_image(instance, update_fields, **kwargs):
+    if instance.pk is None or (
+        update_fields is not None and "image" not in update_fields
+    ):
+        return
+    previous = (
+        Recipe.objects.filter(pk=instance.pk)
+        .values_list("image", flat=True)
+        .first()
+    )
+    # Новый файл еще не сохранен: его имя станет известно позже,
+    # поэтому ссылки на старый проверяются после коммита
+    if previous and previous != instance.image.name:
+        schedule_release(previous)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(instance, **kwargs):
+    if instance.image:
+        schedule_release(instance.image.name)
+
+
+def connect_counter(model, counter, related, field):
+    """
+    Создание related увеличивает счетчик владельца на 1. Удаления
+    копятся до коммита и пересчитываются одним UPDATE: каскадное
+    удаление рецепта или пользователя шлет post_delete на каждую
+    строку, и N отдельных UPDATE были бы лишними. Счетчики удаленных
+    вместе с ними владельцев UPDATE просто не находит.
+    """
+    attname = related._meta.get_field(field).attname
+    deleted = CommitBatch(
+        lambda pks: recount(model, counter, related, field, pks)
+    )
+
+    def increment(instance, created, **kwargs):
+        if created:
+            bump(model, getattr(instance, attname), counter, 1)
+
+    def decrement(instance, using, **kwargs):
+        deleted.add(getattr(instance, attname), using=using)
+
+    post_save.connect(increment, sender=related, weak=False)
+    post_delete.connect(decrement, sender=related, weak=False)
+
+
+for options in COUNTERS:
+    connect_counter(*options)
@@ -0,0 +1,219 @@
+import logging
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from scipy import sparse
+
+from .models import (
+    DataVersion,
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    SimilarRecipe,
+)
+
+logger = logging.getLogger(__name__)
+
+# Строка DataVersion с наибольшим id избранного, учтенным прошлым
+# расчетом. Хранится в БД: кэш процесса команда видит пустым
+FAVORITES_WATERMARK = "similar:favorites"
+
+
+def favorites_watermark():
+    return (
+        DataVersion.objects.filter(name=FAVORITES_WATERMARK)
+        .values_list("value", flat=True)
+        .first()
+    )
+
+
+def save_favorites_watermark(last_favorite):
+    DataVersion.objects.update_or_create(
+        name=FAVORITES_WATERMARK,
+        defaults={"value": last_favorite, "updated_at": timezone.now()},
+    )
+
+
+def pairs(queryset, recipe_ids, other):
+    """
+    (recipe_id, other) из queryset -> (строки матрицы, значения other).
+    Строки рецептов, созданных после загрузки recipe_ids, пропускаются.
+    """
+    flat = np.fromiter(
+        chain.from_iterable(
+            queryset.order_by().values_list("recipe_id", other).iterator()
+        ),
+        dtype=np.int64,
+    )
+    recipes, values = flat[0::2], flat[1::2]
+    known = np.isin(recipes, recipe_ids)
+    return np.searchsorted(recipe_ids, recipes[known]), values[known]
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def ingredient_matrix(recipe_ids, max_share):
+    """
+    Рецепты x ингредиенты с весами TF-IDF, строки нормированы:
+    произведение строк - косинусное сходство составов.
+    """
+    rows, ingredients = pairs(
+        RecipeIngredient.objects.all(), recipe_ids, "ingredient_id"
+    )
+    columns_ids, columns = np.unique(ingredients, return_inverse=True)
+    frequency = np.bincount(columns, minlength=len(columns_ids))
+    idf = np.log((1 + len(recipe_ids)) / (1 + frequency)) + 1
+    idf[frequency > max_share * len(recipe_ids)] = 0
+    matrix = sparse.csr_matrix(
+        (idf[columns], (rows, columns)),
+        shape=(len(recipe_ids), len(columns_ids)),
+    )
+    matrix.eliminate_zeros()
+    return normalize_rows(matrix).tocsr()
+
+
+def favorite_matrix(recipe_ids):
+    """
+    Рецепты x пользователи (избранное), строки нормированы:
+    произведение строк - косинусное сходство по общему избранному.
+    """
+    rows, users = pairs(Favorite.objects.all(), recipe_ids, "user_id")
+    columns_ids, columns = np.unique(users, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, columns)),
+        shape=(len(recipe_ids), len(columns_ids)),
+    )
+    return normalize_rows(matrix).tocsr()
+
+
+def top_neighbours(scores, positions, recipe_ids, top_k):
+    """Строки scores -> [(recipe_id, similar_id, score)] по top_k на строку."""
+    result = []
+    for row, position in enumerate(positions):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        columns = scores.indices[start:end]
+        values = scores.data[start:end]
+        keep = (columns != position) & (values > 0)
+        columns, values = columns[keep], values[keep]
+        if len(values) > top_k:
+            best = np.argpartition(-values, top_k)[:top_k]
+            columns, values = columns[best], values[best]
+        for column, value in zip(columns, values):
+            result.append(
+                (int(recipe_ids[position]), int(recipe_ids[column]),
+                 float(value))
+            )
+    return result
+
+
+def favorited_recipe_ids(after):
+    """
+    Рецепты, добавленные в избранное после Favorite с id after, и все
+    рецепты с общими с ними пользователями: их сходство по избранному
+    с этими рецептами изменилось.
+    """
+    recipes = Favorite.objects.filter(pk__gt=after).values("recipe_id")
+    users = Favorite.objects.filter(recipe_id__in=recipes).values("user_id")
+    return set(
+        Favorite.objects.filter(user_id__in=users)
+        .order_by()
+        .values_list("recipe_id", flat=True)
+        .distinct()
+    )
+
+
+def stale_recipe_ids(favorites_watermark=None):
+    """
+    Рецепты без расчета, измененные после него или с новым избранным
+    (после favorites_watermark), а также рецепты, у которых такие
+    рецепты стоят в похожих.
+    """
+    changed = set(
+        Recipe.objects.filter(
+            Q(similar_computed_at__isnull=True)
+            | Q(updated_at__gt=F("similar_computed_at"))
+        ).values_list("id", flat=True)
+    )
+    if favorites_watermark is not None:
+        changed |= favorited_recipe_ids(favorites_watermark)
+    if not changed:
+        return changed
+    return changed | set(
+        SimilarRecipe.objects.filter(similar_id__in=changed).values_list(
+            "recipe_id", flat=True
+        )
+    )
+
+
+def build_similar(full=False):
+    """
+    Пересчитывает похожие рецепты: сходство составов (TF-IDF, косинус)
+    и сходство по общему избранному, сложенные с весами из
+    SIMILAR_RECIPES. Матрицы строятся по всем рецептам, а строки
+    сходства считаются только для устаревших рецептов (или всех
+    при full=True) порциями по CHUNK_SIZE.
+    Новый рецепт попадает в похожие у старых при их пересчете или
+    при полном перестроении.
+    Новое избранное находится по наибольшему id Favorite на момент
+    прошлого расчета (метка хранится в БД, DataVersion). Удаление из
+    избранного, а до первого расчета и новое избранное учитываются
+    только полным перестроением (--full).
+    Возвращает число пересчитанных рецептов.
+    """
+    options = settings.SIMILAR_RECIPES
+    started = timezone.now()
+    last_favorite = Favorite.objects.aggregate(last=Max("id"))["last"] or 0
+    recipe_ids = np.fromiter(
+        Recipe.objects.order_by("id").values_list("id", flat=True),
+        dtype=np.int64,
+    )
+    if full:
+        targets = recipe_ids
+    else:
+        targets = np.array(
+            sorted(stale_recipe_ids(favorites_watermark())),
+            dtype=np.int64,
+        )
+        targets = targets[np.isin(targets, recipe_ids)]
+    if not len(targets):
+        save_favorites_watermark(last_favorite)
+        return 0
+    ingredients = ingredient_matrix(
+        recipe_ids, options["MAX_INGREDIENT_SHARE"]
+    )
+    favorites = favorite_matrix(recipe_ids)
+    positions = np.searchsorted(recipe_ids, targets)
+    for start in range(0, len(positions), options["CHUNK_SIZE"]):
+        chunk = positions[start:start + options["CHUNK_SIZE"]]
+        scores = (
+            options["INGREDIENT_WEIGHT"]
+            * (ingredients[chunk] @ ingredients.T)
+            + options["FAVORITE_WEIGHT"] * (favorites[chunk] @ favorites.T)
+        ).tocsr()
+        neighbours = top_neighbours(
+            scores, chunk, recipe_ids, options["TOP_K"]
+        )
+        chunk_ids = [int(recipe_ids[position]) for position in chunk]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=chunk_ids).delete()
+            SimilarRecipe.objects.bulk_create(
+                SimilarRecipe(
+                    recipe_id=recipe, similar_id=similar, score=score
+                )
+                for recipe, similar, score in neighbours
+            )
+            # Рецепт, измененный во время расчета, останется устаревшим
+            Recipe.objects.filter(
+                pk__in=chunk_ids, updated_at__lte=started
+            ).update(similar_computed_at=started)
+    save_favorites_watermark(last_favorite)
+    logger.info("Похожие рецепты пересчитаны для %d рецептов", len(targets))
+    return len(targets)
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файлы называются по sha256 содержимого: recipe_images/<sha256>.png.
+    Одинаковое содержимое хранится один раз, а файл по имени никогда
+    не меняется, поэтому gateway отдает такие файлы как immutable.
+    Повторное сохранение существующего файла только обновляет mtime:
+    по нему сборка мусора (recipes/images.py) не трогает файлы, на
+    которые может ссылаться еще не закоммиченная транзакция.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        return super().save(
+            self.hashed_name(name, content), content, max_length
+        )
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        folder, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(folder, digest.hexdigest() + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Занятое имя - то же содержимое, суффикс не нужен
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(
+                f'Storage can not find an available filename for "{name}".'
+            )
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.utime(full_path)
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Файл появляется под своим именем только целиком: параллельная
+        # загрузка того же содержимого не увидит недописанный файл
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(
+                temp_path,
+                0o644
+                if self.file_permissions_mode is None
+                else self.file_permissions_mode,
+            )
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+
+recipe_image_storage = ContentAddressedStorage()
@@ -0,0 +1,25 @@
+from jobs.registry import task
+
+from .counters import reconcile
+from .images import build_variants, collect_garbage
+from .similarity import build_similar
+
+
+@task("recipes.build_image_variants", concurrency=2)
+def build_image_variants(job, recipe_id):
+    build_variants(recipe_id)
+
+
+@task("recipes.reconcile_counters", concurrency=1)
+def reconcile_counters(job):
+    return reconcile()
+
+
+@task("recipes.build_similar", concurrency=1)
+def build_similar_recipes(job, full=False):
+    return {"recipes": build_similar(full=full)}
+
+
+@task("recipes.collect_media", concurrency=1)
+def collect_media(job, dry_run=False):
+    return {"removed": collect_garbage(dry_run=dry_run)}
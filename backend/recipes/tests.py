@@ -0,0 +1,471 @@
+import json
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    SimilarRecipe,
+    Tag,
+)
+from recipes.counters import COUNTERS
+from recipes.images import variants_dir
+from recipes.similarity import build_similar, favorites_watermark
+from recipes.storage import recipe_image_storage
+from users.models import Follow, User
+
+
+class GenerateDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент{number}", measurement_unit="г")
+            for number in range(30)
+        )
+
+    def generate(self, **options):
+        options = {"users": 5, "recipes": 20, "seed": 7, **options}
+        call_command("generate_data", stdout=StringIO(), **options)
+
+    def snapshot(self):
+        users = User.objects.order_by("id").values_list(
+            "username", "email", "password"
+        )
+        recipes = Recipe.objects.order_by("id", "tags__slug").values_list(
+            "author__username",
+            "text",
+            "cooking_time",
+            "pub_date",
+            "updated_at",
+            "tags__slug",
+        )
+        ingredients = RecipeIngredient.objects.order_by("id").values_list(
+            "recipe__name", "ingredient__name", "amount"
+        )
+        return list(users), list(recipes), list(ingredients)
+
+    def test_same_seed_same_data(self):
+        self.generate()
+        first = self.snapshot()
+        with self.assertRaises(CommandError):
+            self.generate()
+        User.objects.all().delete()
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_minimum_counts(self):
+        for option in ("users", "recipes"):
+            with self.subTest(option=option), self.assertRaises(
+                CommandError
+            ):
+                self.generate(**{option: 0})
+        self.assertFalse(User.objects.exists())
+
+
+class LoadCommandTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding="utf-8")
+        return path
+
+    def load(self, path, **options):
+        output = StringIO()
+        call_command("load", path=str(path), stdout=output, **options)
+        return output.getvalue()
+
+    def ingredients(self):
+        return sorted(
+            Ingredient.objects.values_list("name", "measurement_unit")
+        )
+
+    def test_csv(self):
+        path = self.write("data.csv", "Соль,г\nсоль,г\nМолоко, мл\n")
+        self.load(path, batch_size=1)
+        self.assertEqual(
+            self.ingredients(), [("молоко", "мл"), ("соль", "г")]
+        )
+
+    def test_json(self):
+        path = self.write(
+            "data.json",
+            json.dumps(
+                [
+                    {"name": "Соль", "measurement_unit": "г"},
+                    {"name": "молоко", "measurement_unit": "мл"},
+                ]
+            ),
+        )
+        self.load(path)
+        self.assertEqual(
+            self.ingredients(), [("молоко", "мл"), ("соль", "г")]
+        )
+
+    def test_json_invalid_row(self):
+        rows = [
+            {"name": "соль", "measurement_unit": "г"},
+            {"name": "молоко"},
+        ]
+        for broken in (
+            rows,
+            rows[:1] + [{"measurement_unit": "мл"}],
+            rows[:1] + [["молоко", "мл"]],
+            rows[:1] + [{"name": None, "measurement_unit": "мл"}],
+        ):
+            path = self.write("data.json", json.dumps(broken))
+            with self.subTest(row=broken[1]), self.assertRaisesMessage(
+                CommandError, "Некорректная строка 2"
+            ):
+                self.load(path)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_dry_run(self):
+        path = self.write("data.csv", "соль,г\n")
+        output = self.load(path, dry_run=True)
+        self.assertIn("добавлено 1", output)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_reimport_is_idempotent(self):
+        path = self.write("data.csv", "соль,г\nмолоко,мл\n")
+        self.load(path)
+        output = self.load(path)
+        self.assertIn("добавлено 0, уже было 2", output)
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+
+class BuildSimilarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f"user{number}",
+                email=f"user{number}@example.com",
+                password="pass",
+            )
+            for number in range(3)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.users[0],
+                name=f"Рецепт {number}",
+                text="Описание",
+                cooking_time=10,
+            )
+            for number in range(4)
+        ]
+        for user in cls.users[:2]:
+            Favorite.objects.create(user=user, recipe=cls.recipes[0])
+
+    def test_new_favorite_recomputes_co_favorited_recipes(self):
+        self.assertEqual(build_similar(full=True), len(self.recipes))
+        self.assertEqual(build_similar(), 0)
+        Favorite.objects.create(user=self.users[0], recipe=self.recipes[1])
+        # recipes[1] с новым избранным и recipes[0] с общим пользователем
+        self.assertEqual(build_similar(), 2)
+        self.assertEqual(
+            list(
+                SimilarRecipe.objects.filter(
+                    recipe=self.recipes[1]
+                ).values_list("similar_id", flat=True)
+            ),
+            [self.recipes[0].pk],
+        )
+        self.assertEqual(build_similar(), 0)
+
+    def test_watermark_survives_cache_clear(self):
+        build_similar(full=True)
+        # Новый процесс команды начинает с пустым кэшем
+        caches["default"].clear()
+        Favorite.objects.create(user=self.users[2], recipe=self.recipes[2])
+        self.assertEqual(build_similar(), 1)
+        self.assertEqual(
+            favorites_watermark(), Favorite.objects.latest("id").pk
+        )
+
+
+class TouchRecipeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f"тег{number}",
+                color=f"#00000{number}",
+                slug=f"tag{number}",
+            )
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент{number}", measurement_unit="г"
+            )
+            for number in range(3)
+        ]
+        cls.recipes = []
+        # Иначе пачка из setUpTestData ждет коммита всего класса,
+        # и изменения в тестах попадают в нее
+        with cls.captureOnCommitCallbacks(execute=True):
+            for number in range(2):
+                recipe = Recipe.objects.create(
+                    author=author,
+                    name=f"Рецепт {number}",
+                    text="Описание",
+                    cooking_time=10,
+                )
+                recipe.tags.set(cls.tags)
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(
+                        recipe=recipe, ingredient=ingredient, amount=1
+                    )
+                    for ingredient in ingredients
+                )
+                cls.recipes.append(recipe)
+
+    def touches(self, queries):
+        return [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith('UPDATE "recipes_recipe"')
+        ]
+
+    def test_one_update_per_transaction(self):
+        recipe = self.recipes[0]
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                for item in RecipeIngredient.objects.filter(recipe=recipe):
+                    item.delete()
+                recipe.tags.remove(self.tags[0])
+                # Очистка со стороны тега затрагивает оба рецепта
+                self.tags[1].recipe_set.clear()
+            touches = self.touches(queries)
+        self.assertEqual(len(touches), 1, touches)
+        for other in self.recipes:
+            other.refresh_from_db()
+            self.assertGreater(other.updated_at, recipe.pub_date)
+
+    def test_rolled_back_savepoint_does_not_lose_later_changes(self):
+        recipe = self.recipes[0]
+        before = recipe.updated_at
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        recipe.tags.remove(self.tags[0])
+                        raise ValueError
+                except ValueError:
+                    pass
+                recipe.tags.remove(self.tags[1])
+            touches = self.touches(queries)
+        self.assertEqual(len(touches), 1, touches)
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.updated_at, before)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f"user{number}",
+                email=f"user{number}@example.com",
+                password="pass",
+            )
+            for number in range(3)
+        ]
+        self.author = self.users[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes = [
+                Recipe.objects.create(
+                    author=self.author,
+                    name=f"Рецепт {number}",
+                    text="Описание",
+                    cooking_time=10,
+                )
+                for number in range(3)
+            ]
+            for user in self.users[1:]:
+                Follow.objects.create(user=user, author=self.author)
+                for recipe in self.recipes:
+                    Favorite.objects.create(user=user, recipe=recipe)
+                    ShoppingList.objects.create(user=user, recipe=recipe)
+
+    def counters(self):
+        recipes = Recipe.objects.order_by("id").values_list(
+            "favorites_count", "shopping_cart_count"
+        )
+        users = User.objects.order_by("id").values_list(
+            "followers_count", "recipes_count"
+        )
+        return list(recipes), list(users)
+
+    def test_counters_follow_changes(self):
+        self.assertEqual(
+            self.counters(),
+            ([(2, 2)] * 3, [(2, 3), (0, 0), (0, 0)]),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.get(
+                user=self.users[1], recipe=self.recipes[0]
+            ).delete()
+            self.recipes[2].delete()
+        self.assertEqual(
+            self.counters(),
+            ([(1, 2), (2, 2)], [(2, 2), (0, 0), (0, 0)]),
+        )
+
+    def counter_updates(self, queries):
+        return [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith("UPDATE")
+            and "_count" in query["sql"]
+        ]
+
+    def test_cascade_delete_one_update_per_counter(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.users[1].delete()
+            updates = self.counter_updates(queries)
+        # favorites_count, shopping_cart_count и followers_count
+        self.assertEqual(len(updates), 3, updates)
+        self.assertEqual(self.counters(), ([(1, 1)] * 3, [(1, 3), (0, 0)]))
+
+    def test_deleted_owner_is_not_bumped(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.author.delete()
+            updates = self.counter_updates(queries)
+        # Рецепты и подписки удалены вместе с автором: по одному
+        # UPDATE на счетчик, а не на каждую удаленную строку
+        self.assertEqual(len(updates), len(COUNTERS), updates)
+        self.assertEqual(self.counters(), ([], [(0, 0), (0, 0)]))
+
+    def test_reconcile_command(self):
+        Recipe.objects.update(favorites_count=10)
+        User.objects.filter(pk=self.author.pk).update(recipes_count=0)
+        output = StringIO()
+        call_command("reconcile_counters", stdout=output)
+        for line in (
+            "recipes.Recipe.favorites_count: исправлено 3",
+            "users.User.recipes_count: исправлено 1",
+            "users.User.followers_count: исправлено 0",
+        ):
+            self.assertIn(line, output.getvalue())
+        self.assertEqual(
+            self.counters(),
+            ([(2, 2)] * 3, [(2, 3), (0, 0), (0, 0)]),
+        )
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new("RGB", (4, 4), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ImageStorageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Копии ставятся в очередь задач, а не в пул потоков процесса
+        media = override_settings(
+            MEDIA_ROOT=directory.name,
+            RECIPE_IMAGE_GC_GRACE=0,
+            JOBS={**settings.JOBS, "ENABLED": True},
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+
+    def create_recipe(self, content, filename):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=self.author,
+                name=filename,
+                text="Описание",
+                cooking_time=10,
+                image=ContentFile(content, filename),
+            )
+
+    def delete(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+    def files(self):
+        folder = Recipe._meta.get_field("image").upload_to.rstrip("/")
+        return sorted(
+            name
+            for name in recipe_image_storage.listdir(folder)[1]
+            if not name.startswith(".")
+        )
+
+    def test_same_content_stored_once(self):
+        first = self.create_recipe(png("red"), "first.PNG")
+        second = self.create_recipe(png("red"), "second.png")
+        other = self.create_recipe(png("blue"), "other.png")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertRegex(
+            first.image.name, r"^recipe_images/[0-9a-f]{64}\.png$"
+        )
+        self.assertEqual(len(self.files()), 2)
+
+    def test_release_keeps_referenced_file(self):
+        first = self.create_recipe(png("red"), "first.png")
+        second = self.create_recipe(png("red"), "second.png")
+        name = first.image.name
+        variant = recipe_image_storage.save(
+            f"{variants_dir(name)}/small.webp", ContentFile(b"variant")
+        )
+        self.delete(first)
+        self.assertTrue(recipe_image_storage.exists(name))
+        self.assertTrue(recipe_image_storage.exists(variant))
+        self.delete(second)
+        self.assertFalse(recipe_image_storage.exists(name))
+        self.assertFalse(recipe_image_storage.exists(variant))
+
+    def test_collect_media_removes_only_unreferenced(self):
+        recipe = self.create_recipe(png("red"), "recipe.png")
+        orphan = recipe_image_storage.save(
+            "recipe_images/orphan.png", ContentFile(png("blue"))
+        )
+        stale = recipe_image_storage.save(
+            f"{variants_dir(recipe.image.name)}/old.webp",
+            ContentFile(b"variant"),
+        )
+        output = StringIO()
+        call_command("collect_media", dry_run=True, stdout=output)
+        self.assertIn("Будет удалено файлов: 2", output.getvalue())
+        self.assertTrue(recipe_image_storage.exists(orphan))
+        call_command("collect_media", stdout=StringIO())
+        self.assertFalse(recipe_image_storage.exists(orphan))
+        self.assertFalse(recipe_image_storage.exists(stale))
+        self.assertTrue(recipe_image_storage.exists(recipe.image.name))
+
+    @override_settings(RECIPE_IMAGE_GC_GRACE=60 * 60)
+    def test_recent_file_survives_collect_media(self):
+        orphan = recipe_image_storage.save(
+            "recipe_images/orphan.png", ContentFile(png("blue"))
+        )
+        call_command("collect_media", stdout=StringIO())
+        self.assertTrue(recipe_image_storage.exists(orphan))
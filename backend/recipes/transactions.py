@@ -0,0 +1,48 @@
+import threading
+import weakref
+
+from django.db import transaction
+
+
+class PendingBatch(set):
+    """Значения одной транзакции; вызывается Django после коммита."""
+
+    def __init__(self, flush):
+        super().__init__()
+        self.flush = flush
+        self.flushed = False
+
+    def __call__(self):
+        self.flushed = True
+        self.flush(self)
+
+
+class CommitBatch:
+    """
+    Собирает значения за транзакцию и после коммита передает их flush
+    одним вызовом: N сигналов внутри транзакции - один запрос вместо N.
+    Вне транзакции flush вызывается сразу.
+    На пачку ссылается только список on_commit соединения, а здесь
+    хранится слабая ссылка: после отката транзакции или точки
+    сохранения Django выбрасывает колбэк, пачка исчезает, и следующее
+    значение открывает новую.
+    """
+
+    def __init__(self, flush):
+        self.flush = flush
+        self.local = threading.local()
+
+    def add(self, *values, using=None):
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            if values:
+                self.flush(set(values))
+            return
+        batches = getattr(self.local, "batches", None)
+        if batches is None:
+            batches = self.local.batches = weakref.WeakValueDictionary()
+        batch = batches.get(connection.alias)
+        if batch is None or batch.flushed:
+            batch = batches[connection.alias] = PendingBatch(self.flush)
+            transaction.on_commit(batch, using=connection.alias)
+        batch.update(values)
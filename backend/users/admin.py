@@ -1,17 +1,29 @@
 from django.contrib import admin
 
+from foodgram.admin import ScalableModelAdmin
+
 from .models import Follow, User
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
-    list_display = ("pk", "email", "username", "first_name", "last_name")
+class UserAdmin(ScalableModelAdmin):
+    list_display = (
+        "pk",
+        "email",
+        "username",
+        "first_name",
+        "last_name",
+        "followers_count",
+        "recipes_count",
+    )
+    readonly_fields = ("followers_count", "recipes_count")
     search_fields = ("email", "username", "first_name", "last_name")
-    list_filter = ("email", "username", "first_name", "last_name")
+    list_filter = ("is_active", "is_staff")
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableModelAdmin):
     list_display = ("pk", "user", "author")
-    search_fields = ("user", "author")
-    list_filter = ("user", "author")
+    list_select_related = ("user", "author")
+    autocomplete_fields = ("user", "author")
+    search_fields = ("user__username", "author__username")
@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 07:50
+
+from django.db import migrations
+
+
+def create_username_index(apps, schema_editor):
+    # istartswith на Postgres - UPPER(username::text) LIKE UPPER('x%');
+    # обычный индекс username такой запрос не использует
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS user_username_upper_idx '
+        'ON users_user (UPPER(username::text) text_pattern_ops)'
+    )
+
+
+def drop_username_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS user_username_upper_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_username_index, drop_username_index),
+    ]
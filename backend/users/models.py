@@ -8,6 +8,8 @@ class User(AbstractUser):
         max_length=320,
         unique=True,
     )
+    # Поиск по началу имени без учета регистра использует индекс
+    # UPPER(username), созданный миграцией 0005 (только Postgres)
     username = models.CharField(
         "Имя пользователя",
         max_length=255,
@@ -21,6 +23,13 @@ class User(AbstractUser):
         "Фамилия",
         max_length=255,
     )
+    # Счетчики поддерживаются сигналами (recipes/counters.py)
+    followers_count = models.PositiveIntegerField(
+        "Подписчиков", default=0, editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        "Рецептов", default=0, editable=False
+    )
 
     class Meta:
         ordering = ("username",)
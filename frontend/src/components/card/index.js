@@ -2,11 +2,13 @@ import styles from './style.module.css'
 import { LinkComponent, Icons, Button, TagsContainer } from '../index'
 import { useState, useContext } from 'react'
 import { AuthContext } from '../../contexts'
+import imageVariant from '../../utils/image-variant'
 
 const Card = ({
   name = 'Без названия',
   id,
   image,
+  image_variants,
   is_favorited,
   is_in_shopping_cart,
   tags,
@@ -21,7 +23,7 @@ const Card = ({
       <LinkComponent
         className={styles.card__title}
         href={`/recipes/${id}`}
-        title={<div className={styles.card__image} style={{ backgroundImage: `url(${ image })` }} />}
+        title={<div className={styles.card__image} style={{ backgroundImage: `url(${ imageVariant(image, image_variants, 'card') })` }} />}
       />
       <div className={styles.card__body}>
         <LinkComponent
@@ -0,0 +1,17 @@
+const supportsWebp = (() => {
+  try {
+    return document.createElement('canvas').toDataURL('image/webp').startsWith('data:image/webp')
+  } catch (e) {
+    return false
+  }
+})()
+
+// Уменьшенная копия картинки рецепта (thumbnail, card, full);
+// пока копии не построены, используется исходная картинка
+const imageVariant = (image, variants, variant) => {
+  const formats = variants && variants[variant]
+  if (!formats) { return image }
+  return (supportsWebp && formats.webp) || formats.jpeg || image
+}
+
+export default imageVariant